@@ -1,9 +1,59 @@
+import os
+
+
 class Config:
 	def __init__(self):
 		self.domain = "https://code-runner-plugin-git-template-xiyz-gis-projects.vercel.app" # 部署CodeRunner-Plugin的域名或ip,要求协议完整eg.https://example.com or http://example.com
 		self.proxydomain = "https://proxy.nuoxero.xyz/proxy/https://code-runner-plugin-git-template-xiyz-gis-projects.vercel.app/" # CodeRunner-Plugin 的代理服务器域名或ip，由于vercel域名或ip可能被墙，代码或图片在国内无法下载，若不需要代理则与self.domain内容相同
 		self.dbname = "Cluster0" # mongodb数据库名称,在mongodb官网注册后会赠送一个免费数据库
 		self.CORS = False # 是否开启CORS，开启则需要Referer与self.domain或self.proxydomain相同才能访问
+		self.python_workers = os.cpu_count() or 1 # 本地运行Python代码的预启动进程数，默认与CPU核心数相同，至少为1，代码总是在独立进程中运行，超时会被杀掉
+		self.python_preload = ["numpy", "pandas", "matplotlib"] # 每个Python进程启动时预先导入的库，避免每次运行都要导入
+		self.run_timeout = 30 # 每次运行代码的默认超时时间(秒)，超时的Python进程会被强制结束
+		self.max_run_timeout = 120 # 请求中timeout参数允许的最大值(秒)
+		self.output_limit = 1024 * 1024 # 每次运行保留在内存中的输出字符数上限，超出后完整输出写入MongoDB GridFS并返回下载链接
+		self.output_preview = 4096 # 输出被截断时返回的开头与结尾部分的字符数
+		self.code_cache_entries = 256 # 已编译Python代码缓存的最大条目数
+		self.code_cache_bytes = 32 * 1024 * 1024 # 已编译Python代码缓存的最大字节数
+		self.result_cache = False # 是否缓存/run_code的运行结果，相同的语言、代码、输入和compileOnly直接返回缓存结果，请求中noCache为true时不使用缓存
+		self.result_cache_ttl = 300 # 运行结果缓存的有效时间(秒)
+		self.result_cache_entries = 1024 # 进程内运行结果缓存的最大条目数
+		self.result_cache_mongo = False # 是否同时把运行结果缓存到MongoDB，供多个实例共享
+		self.batch_max_jobs = 50 # /run_batch每次最多允许的任务数
+		self.batch_concurrency = 4 # /run_batch同时调用JDoodle的最大任务数，Python任务由进程池控制并发
+		self.run_cpu_limit = 30 # 每次运行Python代码允许使用的CPU时间(秒)
+		self.run_memory_limit = 512 * 1024 * 1024 # 每次运行Python代码在预加载库之外允许额外使用的内存(字节)
+		self.run_file_limit = 64 # 每次运行Python代码允许打开的文件数
+		self.run_file_size_limit = 16 * 1024 * 1024 # 每次运行Python代码允许写入的单个文件大小(字节)
+		self.run_output_limit = 64 * 1024 * 1024 # 每次运行Python代码允许输出的最大字符数
+		self.credit_sync_interval = 300 # 本地记录的JDoodle已用额度与credit-spent接口同步的间隔(秒)
+		self.jdoodle_daily_limit = 200 # 每个JDoodle账号每天的额度，额外账号通过JDOODLE_CREDENTIALS环境变量添加(id:secret,id:secret)
+		self.jdoodle_failure_threshold = 3 # JDoodle账号连续失败多少次后暂停使用(熔断)
+		self.jdoodle_reset_timeout = 60 # 熔断的JDoodle账号暂停多久后再试一次(秒)
+		self.default_routing = "jdoodle" # 非Python语言的运行方式: "jdoodle"只使用JDoodle; "auto"优先使用本机编译器/解释器，未安装则使用JDoodle; "local"只在本机运行。本机运行只有rlimit限制，没有文件系统和网络隔离，需确认后再开启
+		self.language_routing = {} # 按JDoodle语言代码单独设置运行方式，覆盖default_routing，eg.{"java": "jdoodle", "c": "local"}
+		self.local_concurrency = os.cpu_count() or 1 # 同时在本机运行的非Python程序的最大数量
+		self.artifact_cache_dir = "/tmp/code-runner-artifacts" # 本地编译产物(可执行文件等)的缓存目录，设为空则不缓存
+		self.artifact_cache_bytes = 256 * 1024 * 1024 # 编译产物缓存的最大总大小(字节)，超出后删除最久未使用的
+		self.tests_max_cases = 100 # /run_tests每次最多允许的测试用例数
+		self.jdoodle_retries = 2 # JDoodle请求连接失败或返回429/5xx时的最大重试次数(带随机退避)
+		self.jdoodle_retry_backoff = 0.2 # 重试退避的基础时间(秒)，每次重试翻倍
+		self.jdoodle_hedge = False # 是否在请求慢于近期p95延迟时用另一个JDoodle账号再发一次请求，先返回的结果生效
+		self.jdoodle_hedge_quantile = 0.95 # 触发对冲请求的延迟分位数
+		self.http_timeout = 10 # 调用外部服务(JDoodle、Kod.so、QuickChart、短链接)的默认超时时间(秒)
+		self.http_connect_timeout = 5 # 建立连接的超时时间(秒)
+		self.http_max_connections = 100 # 共享HTTP客户端的最大连接数
+		self.http_max_keepalive = 20 # 保持长连接(keep-alive)的最大空闲连接数
+		self.http_keepalive_expiry = 30 # 空闲长连接保留的时间(秒)
+		self.request_deadline = 20 # 除运行代码外每个请求的总时限(秒)，其中所有外部服务和MongoDB调用共享这个时限，超时则返回已有的部分结果
+		self.file_catalog = True # 维护文件名→存储桶的目录集合(file_catalog)，/download只需一次索引查询即可找到文件，关闭后按扩展名依次查找各个存储桶
+		self.write_behind = "acknowledged" # save_code和用户webhook写入的持久性: "off"每次单独写入，"acknowledged"合并成bulk_write批量写入并在写入后返回，"buffered"放入队列后立即返回(进程崩溃最多丢失一个间隔的写入)
+		self.write_behind_batch = 100 # 队列中的写操作达到这个数量时立即写入
+		self.write_behind_interval = 0.05 # 批量写入的间隔(秒)
+		self.list_files = False # 是否开放/files接口分页列出所有已存储的文件(会暴露所有用户的文件名)
+		self.list_files_page = 100 # /files每页默认返回的文件数
+		self.list_files_max_page = 1000 # /files每页最多返回的文件数
+		self.image_chunk_size = 255 * 1024 # 图片存入GridFS时每个块(chunk)的字节数，上传和下载都按块流式读写
 		self.api_url = "http://7dk1cvezn.mghost.site/api.php" # 短域名api服务器地址
 		#这里提供一个测试的地址，不保证稳定性与速度
 # api_url : http://7dk1cvezn.mghost.site/api.php
@@ -0,0 +1,123 @@
+"""
+Description: On-disk cache of the files produced by compiling a program.
+Entries are directories keyed by the hash of the source, the compiler and its flags,
+so unchanged code skips compilation and only copies the artifacts. The cache is
+bounded by total size in bytes and evicts the least recently used entries, using
+the directory mtime as the last use so the order survives restarts.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+
+class ArtifactCache:
+    # Constructor to set the cache directory and its size bound.
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    # Method to write logs to a file.
+    def write_log(self, log_msg: str):
+        try:
+            print(str(datetime.now()) + " " + log_msg)
+        except Exception as e:
+            print(str(e))
+
+    # Method to build the cache key from everything that changes the artifacts.
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha256(json.dumps(parts).encode("utf-8", "surrogatepass")).hexdigest()
+
+    @staticmethod
+    def _directory_size(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+    # Method to index the entries left by a previous run, oldest first.
+    def _load(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith(".") or not os.path.isdir(path):
+                continue
+            try:
+                entries.append((os.path.getmtime(path), name, self._directory_size(path)))
+            except OSError:
+                continue
+        for _, name, size in sorted(entries):
+            self._entries[name] = size
+            self._size += size
+        self._evict()
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._entries:
+            name, size = self._entries.popitem(last=False)
+            self._size -= size
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    # Method to copy the artifacts of a key into destination, returns False on a miss.
+    def get(self, key, destination):
+        path = os.path.join(self.directory, key)
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return False
+            self._entries.move_to_end(key)
+            self.hits += 1
+        try:
+            for name in os.listdir(path):
+                shutil.copy2(os.path.join(path, name), os.path.join(destination, name))
+            os.utime(path)
+            return True
+        except OSError as e:
+            # The entry was evicted while it was copied.
+            self.write_log(f"ArtifactCache: failed to read {key}: {e}")
+            return False
+
+    # Method to store the given files of source_directory under a key.
+    def put(self, key, source_directory, names):
+        size = sum(os.path.getsize(os.path.join(source_directory, name)) for name in names)
+        # Entries bigger than the whole cache are not kept.
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+        # Written next to the entries and renamed, so readers never see half an entry.
+        staging = tempfile.mkdtemp(prefix=".staging-", dir=self.directory)
+        try:
+            for name in names:
+                shutil.copy2(os.path.join(source_directory, name), os.path.join(staging, name))
+            os.rename(staging, os.path.join(self.directory, key))
+        except OSError as e:
+            self.write_log(f"ArtifactCache: failed to store {key}: {e}")
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+        with self._lock:
+            self._entries[key] = size
+            self._size += size
+            self._evict()
+
+    # Method to get the cache counters.
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._size,
+            }
@@ -0,0 +1,416 @@
+"""
+Description: Async-native variant of the MongoDB class for the request handlers.
+It has the same methods as lib/mongo_db.MongoDB, but they are coroutines on the
+asyncio client of pymongo, so a handler awaits the database instead of blocking the
+event loop or holding a thread for each call. GridFS files are streamed in chunks
+in both directions, so a download is sent while it is still being read.
+"""
+
+import os
+import base64
+import random
+import string
+from datetime import datetime
+from typing import Optional
+
+from dotenv import load_dotenv
+from bson import ObjectId
+from pymongo import AsyncMongoClient, InsertOne, UpdateOne
+from pymongo.server_api import ServerApi
+from gridfs import AsyncGridFS, AsyncGridFSBucket, NoFile
+
+from config import Config
+from lib.mongo_db import (INDEXES, FILE_CATALOG, LISTED_BUCKETS, DEFAULT_LISTED_BUCKETS, missing_indexes,
+                          listing_collection, listing_query, encode_cursor, decode_cursor)
+
+config = Config()
+plugin_url = config.proxydomain
+dataset = config.dbname
+
+
+class AsyncMongoDB:
+    MONGODB_URI = None
+    # WriteBehindQueue batching the code saves and user writes, None to write them one by one.
+    write_behind = None
+
+    # Constructor, the client connects on the first operation in the running event loop.
+    def __init__(self):
+        self.write_log("AsyncMongoDB loading environment variables")
+        self._load_env()
+        self._connect()
+
+        # Creating gridfs instances, same buckets as MongoDB.
+        self.graphs = AsyncGridFS(self.db, "graphs")
+        self.codes = AsyncGridFS(self.db, "codes")
+        self.docs = AsyncGridFS(self.db, "docs")
+        self.img = AsyncGridFS(self.db, "img")
+        self.users = AsyncGridFS(self.db, "users")
+        self.snippets = AsyncGridFS(self.db, "snippets")
+        self.outputs = AsyncGridFS(self.db, "outputs")
+
+    def _connect(self):
+        try:
+            self.client = AsyncMongoClient(self.MONGODB_URI, server_api=ServerApi("1"))
+            self.db = self.client.get_default_database(dataset)
+            self.write_log("AsyncMongoDB client created")
+        except Exception as e:
+            self.write_log(f"Failed to create the database client: {e}")
+            raise e
+
+    def _load_env(self):
+        load_dotenv()
+        self.MONGODB_URI = os.getenv("MONGODB_URI")
+
+    @staticmethod
+    def _generate_file_name():
+        return "".join(random.choice(string.ascii_letters) for i in range(10)) + ".py"
+
+    def write_log(self, log_msg: str):
+        try:
+            print(str(datetime.now()) + " " + log_msg)
+        except Exception as e:
+            print(str(e))
+
+    # Method to send one write, through the write-behind queue when there is one.
+    async def _write(self, collection, operation, key=None):
+        if self.write_behind is not None:
+            await self.write_behind.submit(collection, operation, key)
+        else:
+            await self.db[collection].bulk_write([operation])
+
+    async def _add_data(self, data, collection):
+        try:
+            result = await self.db[collection].insert_one(data)
+            self.write_log(f"Added data to {collection} with id {result.inserted_id}")
+            return result
+        except Exception as e:
+            self.write_log(f"Failed to add data to {collection}: {e}")
+            raise e
+
+    async def _update_data(self, query, data, collection):
+        try:
+            result = await self.db[collection].update_one(query, {"$set": data})
+            self.write_log(f"Updated {result.modified_count} document(s) in {collection} matching {query}")
+            return result.modified_count
+        except Exception as e:
+            self.write_log(f"Failed to update data in {collection}: {e}")
+            raise e
+
+    async def _find_data(self, query, collection):
+        try:
+            result = await self.db[collection].find_one(query)
+            self.write_log(f"Found data in {collection} matching {query}")
+            return result
+        except Exception as e:
+            self.write_log(f"Failed to find data in {collection}: {e}")
+            raise e
+
+    async def _delete_data(self, query, collection):
+        try:
+            result = await self.db[collection].delete_one(query)
+            self.write_log(f"Deleted {result.deleted_count} document(s) from {collection} matching {query}")
+            return result.deleted_count
+        except Exception as e:
+            self.write_log(f"Failed to delete data from {collection}: {e}")
+            raise e
+
+    async def save_code(self, script: str, language: str, code_id: str, filename: str) -> Optional[dict]:
+        try:
+            if filename is None:
+                filename = self._generate_file_name()
+            # The id is made here so it is known before a queued insert is written.
+            document = {"_id": ObjectId(), "script": script, "language": language, "id": code_id, "filename": filename, "timestamp": datetime.now()}
+            await self._write("codes", InsertOne(document))
+            self.write_log(f"Added code with language {language} and filename {filename} with id {document['_id']}")
+            return document["_id"]
+        except Exception as e:
+            self.write_log(f"Error while adding code with language {language} with id {code_id}: {e}")
+            return None
+
+    async def update_code(self, script: str, language: str, code_id: str) -> Optional[bool]:
+        try:
+            modified = await self._update_data({"id": code_id}, {"script": script, "language": language}, "codes")
+            self.write_log(f"Updated code with language {language} with id {code_id}")
+            return modified > 0
+        except Exception as e:
+            self.write_log(f"Error while updating code with language {language} with id {code_id}: {e}")
+            return None
+
+    # One query on the filename index returning only the script.
+    async def find_code(self, filename: str) -> Optional[str]:
+        try:
+            response = await self.db["codes"].find_one({"filename": filename}, {"script": 1, "_id": 0})
+            if response and response.get("script"):
+                self.write_log(f"Found code with filename {filename}")
+                return response["script"]
+            self.write_log(f"No code found with filename {filename}")
+            return None
+        except Exception as e:
+            self.write_log(f"Error while finding code with filename {filename}: {e}")
+            return None
+
+    async def delete_code(self, code_id: str) -> Optional[bool]:
+        try:
+            deleted = await self._delete_data({"id": code_id}, "codes")
+            self.write_log(f"Deleted code with id {code_id}")
+            return deleted > 0
+        except Exception as e:
+            self.write_log(f"Error while deleting code with id {code_id}: {e}")
+            return None
+
+    # Images are stored in the graphs GridFS bucket, read from disk and written one chunk at a time.
+    async def save_image(self, image_path: str, image_id: str) -> Optional[str]:
+        try:
+            with open(image_path, "rb") as f:
+                file_id = await self.bucket("graphs", config.image_chunk_size).upload_from_stream(
+                    image_id, f, metadata={"id": image_id, "timestamp": datetime.now()})
+            await self.register_file(image_id, "graphs", file_id)
+            self.write_log(f"Stored image {image_path} with id {file_id}")
+            return str(file_id)
+        except Exception as e:
+            self.write_log(f"Failed to store image {image_path}: {e}")
+            raise e
+
+    async def download_image(self, image_id: str, download_path: str) -> Optional[str]:
+        try:
+            grid_out = await self.bucket("graphs").open_download_stream_by_name(image_id)
+        except NoFile:
+            return await self._download_legacy_image(image_id, download_path)
+        try:
+            with open(download_path, "wb") as f:
+                async for chunk in self.stream_file(grid_out):
+                    f.write(chunk)
+            self.write_log(f"Downloaded image {image_id} to {download_path}")
+            return download_path
+        except Exception as e:
+            self.write_log(f"Failed to download image {image_id}: {e}")
+            raise e
+
+    # Images saved before GridFS are base64 documents of the graphs collection (see tools/migrate_images.py).
+    async def _download_legacy_image(self, image_id: str, download_path: str) -> Optional[str]:
+        document = await self._find_data({"id": image_id}, "graphs")
+        if not document or not document.get("image"):
+            self.write_log(f"No image found with id {image_id}")
+            return None
+        with open(download_path, "wb") as f:
+            f.write(base64.b64decode(document["image"]))
+        self.write_log(f"Downloaded legacy image {image_id} to {download_path}")
+        return download_path
+
+    async def delete_image(self, image_id: str) -> Optional[bool]:
+        try:
+            bucket = self.bucket("graphs")
+            deleted = 0
+            async for file in self.db["graphs.files"].find({"filename": image_id}, {"_id": 1}):
+                await bucket.delete(file["_id"])
+                deleted += 1
+            deleted += await self._delete_data({"id": image_id}, "graphs")
+            self.write_log(f"Deleted image {image_id}")
+            return deleted > 0
+        except Exception as e:
+            self.write_log(f"Failed to delete image {image_id}: {e}")
+            raise e
+
+    # Method to get a GridFS bucket by name, chunk_size is the size of the chunks it writes.
+    def bucket(self, bucket_name: str, chunk_size: Optional[int] = None):
+        if chunk_size:
+            return AsyncGridFSBucket(self.db, bucket_name=bucket_name, chunk_size_bytes=chunk_size)
+        return AsyncGridFSBucket(self.db, bucket_name=bucket_name)
+
+    # Method to open a GridFS upload stream for script output that is too large to return inline.
+    async def open_output_stream(self, filename: str):
+        self.write_log(f"Opening output stream for {filename}")
+        stream = self.bucket("outputs").open_upload_stream(filename, metadata={"contentType": "text/plain", "timestamp": datetime.now()})
+        await self.register_file(filename, "outputs", stream._id)
+        return stream
+
+    # Method to record in which bucket a GridFS file is stored, when the file catalog is on.
+    async def register_file(self, filename: str, bucket: str, file_id):
+        if not config.file_catalog:
+            return
+        try:
+            await self.db[FILE_CATALOG].update_one({"filename": filename},
+                                                   {"$set": {"bucket": bucket, "file_id": file_id, "timestamp": datetime.now()}},
+                                                   upsert=True)
+        except Exception as e:
+            self.write_log(f"Failed to register {filename} in the file catalog: {e}")
+
+    # Method to find the bucket and id of a file in the catalog, one query on its unique filename index.
+    async def locate_file(self, filename: str) -> Optional[dict]:
+        if not config.file_catalog:
+            return None
+        return await self.db[FILE_CATALOG].find_one({"filename": filename}, {"bucket": 1, "file_id": 1, "_id": 0})
+
+    # Method to open a GridFS file by its id, returns None when it does not exist.
+    async def open_file(self, bucket_name: str, file_id):
+        try:
+            return await self.bucket(bucket_name).open_download_stream(file_id)
+        except NoFile:
+            return None
+
+    # Method to create the indexes of INDEXES and verify they exist, returns the missing ones.
+    async def ensure_indexes(self):
+        for collection, indexes in INDEXES.items():
+            for keys, options in indexes:
+                try:
+                    await self.db[collection].create_index(keys, **options)
+                except Exception as e:
+                    self.write_log(f"Failed to create index {keys} on {collection}: {e}")
+        index_information = {collection: await self.db[collection].index_information() for collection in INDEXES}
+        missing = missing_indexes(index_information)
+        if missing:
+            self.write_log(f"AsyncMongoDB: missing indexes {missing}")
+        else:
+            self.write_log(f"AsyncMongoDB: verified the indexes of {len(INDEXES)} collections")
+        return missing
+
+    # Method to store a file from an iterable or async iterable of byte chunks, returns its id.
+    async def upload_stream(self, bucket_name: str, filename: str, chunks, metadata: Optional[dict] = None, chunk_size: Optional[int] = None):
+        grid_in = self.bucket(bucket_name, chunk_size).open_upload_stream(filename, metadata=metadata)
+        try:
+            if hasattr(chunks, "__aiter__"):
+                async for chunk in chunks:
+                    await grid_in.write(chunk)
+            else:
+                for chunk in chunks:
+                    await grid_in.write(chunk)
+        except BaseException:
+            await grid_in.abort()
+            raise
+        await grid_in.close()
+        self.write_log(f"Stored {filename} in {bucket_name} with id {grid_in._id}")
+        return grid_in._id
+
+    # Method to open the latest version of a GridFS file, returns None when it does not exist.
+    async def find_file(self, bucket_name: str, filename: str):
+        return await getattr(self, bucket_name).find_one({"filename": filename})
+
+    # Async generator yielding the chunks of an opened GridFS file, for streaming responses.
+    @staticmethod
+    async def stream_file(grid_out):
+        while True:
+            chunk = await grid_out.readchunk()
+            if not chunk:
+                break
+            yield chunk
+
+    async def _get_total_documents(self, collection):
+        try:
+            return await self.db[collection].count_documents({})
+        except Exception as e:
+            self.write_log(f"Failed to get total documents in {collection}: {e}")
+            raise e
+
+    async def get_total_codes(self):
+        return await self._get_total_documents("codes")
+
+    async def get_total_images(self):
+        return await self._get_total_documents("graphs.files") + await self._get_total_documents("graphs")
+
+    async def _delete_all_documents(self, collection):
+        try:
+            result = await self.db[collection].delete_many({})
+            self.write_log(f"Deleted {result.deleted_count} document(s) from {collection}")
+            return result.deleted_count
+        except Exception as e:
+            self.write_log(f"Failed to delete documents from {collection}: {e}")
+            raise e
+
+    async def delete_all_codes(self):
+        return await self._delete_all_documents("codes")
+
+    async def delete_all_graphs(self):
+        await self._delete_all_documents("graphs.files")
+        return await self._delete_all_documents("graphs.chunks")
+
+    async def delete_all_documents(self):
+        await self._delete_all_documents("docs.files")
+        return await self._delete_all_documents("docs.chunks")
+
+    async def reset_database(self):
+        await self.delete_all_codes()
+        await self.delete_all_graphs()
+        await self.delete_all_documents()
+        self.write_log("Resetting database to initial state")
+
+    async def list_all_collections(self):
+        data_list = []
+        for bucket in DEFAULT_LISTED_BUCKETS:
+            async for item in self.db[listing_collection(bucket)].find({"filename": {"$exists": True}}, {"filename": 1, "_id": 0}):
+                data_list.append({"filename": f'{plugin_url}/download/' + item["filename"]})
+        return data_list
+
+    # Async generator listing a page of stored files in creation order, bucket after bucket.
+    # Yields {filename, bucket, url, timestamp} per file, then {"cursor": ...} when more files remain.
+    # since and until are datetimes, cursor is the one of the previous page (raises ValueError when invalid).
+    async def list_files(self, buckets=None, since=None, until=None, cursor=None, limit=100):
+        buckets = [bucket for bucket in LISTED_BUCKETS if bucket in (buckets or DEFAULT_LISTED_BUCKETS)]
+        position = decode_cursor(cursor) if cursor else None
+        remaining = limit
+        last = position
+        for bucket in buckets:
+            if position and LISTED_BUCKETS.index(bucket) < LISTED_BUCKETS.index(position[0]):
+                continue
+            after = position[1] if position and position[0] == bucket else None
+            # One more file than the page needs tells whether there is a next page.
+            documents = self.db[listing_collection(bucket)].find(listing_query(since, until, after), {"filename": 1})
+            async for item in documents.sort("_id", 1).limit(remaining + 1):
+                if remaining == 0:
+                    yield {"cursor": encode_cursor(*last)}
+                    return
+                yield {"filename": item["filename"], "bucket": bucket,
+                       "url": f'{plugin_url}/download/' + item["filename"],
+                       "timestamp": item["_id"].generation_time.isoformat()}
+                remaining -= 1
+                last = (bucket, item["_id"])
+
+    async def create_new_collection(self, collection_name):
+        try:
+            await self.db.create_collection(collection_name)
+            print(f"Created new collection {collection_name}")
+        except Exception as e:
+            print("Exception: ", e)
+
+    async def create_user(self, user_id=None, user_email=None, user_password=None, created_at_ms=None, updated_at_ms=None, is_verified=None):
+        try:
+            if user_id is None or user_email is None:
+                print("db_create_user: User id and email cannot be empty")
+                return
+            user = {
+                "id": user_id,
+                "email": user_email,
+                "password": user_password,
+                "createdAt": created_at_ms,
+                "updatedAt": updated_at_ms,
+                "isVerified": is_verified
+            }
+            await self._write("users", InsertOne(user))
+            print(f"Added new user to collection users")
+        except Exception as e:
+            print("Exception: ", e)
+
+    async def update_user(self, user_id=None, user_email=None, user_password=None, created_at_ms=None, updated_at_ms=None, is_verified=None):
+        try:
+            if user_id is None or user_email is None:
+                print("db_update_user: User id and email cannot be empty")
+                return
+            update = {"$set": {"email": user_email, "password": user_password, "createdAt": created_at_ms, "updatedAt": updated_at_ms, "isVerified": is_verified}}
+            # Each update sets every field, so queued updates of a user collapse to the last one.
+            await self._write("users", UpdateOne({"id": user_id}, update), ("user", user_id))
+            print(f"db_update_user: user successfully updated")
+        except Exception as e:
+            print("Exception: ", e)
+
+    async def update_user_quota(self, user_id=None, quota=None):
+        try:
+            if user_id is None or quota is None:
+                print("db_update_quota: User id and quota cannot be empty")
+                return
+            await self._write("users", UpdateOne({"id": user_id}, {"$set": {"quota": quota}}), ("quota", user_id))
+            print(f"db_update_quota: user successfully updated")
+        except Exception as e:
+            print("Exception: ", e)
+
+    # Method to close the connections of the client, called when the app stops.
+    async def close(self):
+        await self.client.close()
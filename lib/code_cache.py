@@ -0,0 +1,81 @@
+"""
+Description: LRU cache of compiled Python scripts.
+Scripts are compiled once, keyed by the SHA-256 of their source, and stored as
+marshal bytes so they can be sent to the worker processes without compiling again.
+The cache is bounded both by number of entries and by total size in bytes.
+"""
+
+import hashlib
+import marshal
+import threading
+from collections import OrderedDict
+
+
+# Method to get the cache key of a script.
+def source_hash(source: str) -> str:
+    return hashlib.sha256(source.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+class CodeCache:
+    # Constructor to set the bounds of the cache.
+    def __init__(self, max_entries=256, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # Scripts the workers already had in their own cache, so no bytecode was sent.
+        self.worker_hits = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    # Method to get the key and marshalled bytecode of a script, compiling it on a miss.
+    # Raises SyntaxError like exec() would for invalid scripts.
+    def get(self, source: str):
+        key = source_hash(source)
+        with self._lock:
+            bytecode = self._entries.get(key)
+            if bytecode is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return key, bytecode
+            self.misses += 1
+
+        bytecode = marshal.dumps(compile(source, "<string>", "exec", dont_inherit=True))
+        self._put(key, bytecode)
+        return key, bytecode
+
+    # Method to get a ready to exec code object for a script.
+    def load(self, source: str):
+        return marshal.loads(self.get(source)[1])
+
+    def _put(self, key, bytecode):
+        # Entries bigger than the whole cache are not kept.
+        if len(bytecode) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = bytecode
+            self._size += len(bytecode)
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    # Method to count a script that a worker already had compiled.
+    def record_worker_hit(self):
+        with self._lock:
+            self.worker_hits += 1
+
+    # Method to get the cache counters.
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "worker_hits": self.worker_hits,
+                "entries": len(self._entries),
+                "bytes": self._size,
+            }
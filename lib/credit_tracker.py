@@ -0,0 +1,114 @@
+"""
+Description: Local accounting of the JDoodle credits spent per client.
+Every execute call increments a counter instead of asking the credit-spent API,
+and the counter is resynced with credit-spent in the background on an interval.
+Counters are kept per UTC day (JDoodle resets the credits daily) and are persisted
+in MongoDB when a collection is given, so serverless instances share them.
+"""
+
+import time
+import asyncio
+import threading
+from datetime import datetime, timezone
+
+from pymongo import ReturnDocument
+
+
+class CreditTracker:
+    # Constructor, fetch_used(client_id) is the coroutine function returning the credits spent upstream.
+    def __init__(self, fetch_used, collection=None, sync_interval=300):
+        self.fetch_used = fetch_used
+        self.collection = collection
+        self.sync_interval = sync_interval
+        self._used = {}
+        self._synced_at = {}
+        self._syncing = set()
+        self._tasks = set()
+        self._lock = threading.Lock()
+
+    # Method to write logs to a file.
+    def write_log(self, log_msg: str):
+        try:
+            print(str(datetime.now()) + " " + log_msg)
+        except Exception as e:
+            print(str(e))
+
+    @staticmethod
+    def _today():
+        return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+    def _key(self, client_id):
+        return f"{client_id}:{self._today()}"
+
+    # Method to get the credits spent today by a client, blocking on the first call to read MongoDB.
+    def used(self, client_id):
+        key = self._key(client_id)
+        with self._lock:
+            if key in self._used:
+                return self._used[key]
+        used = 0
+        if self.collection is not None:
+            try:
+                document = self.collection.find_one({"_id": key})
+                used = document["used"] if document else 0
+            except Exception as e:
+                self.write_log(f"CreditTracker: failed to load credits of {client_id}: {e}")
+        with self._lock:
+            return self._used.setdefault(key, used)
+
+    def _increment(self, client_id, count):
+        key = self._key(client_id)
+        if self.collection is not None:
+            try:
+                # The shared counter wins, other instances may have spent credits too.
+                document = self.collection.find_one_and_update({"_id": key}, {"$inc": {"used": count}}, upsert=True, return_document=ReturnDocument.AFTER)
+                with self._lock:
+                    self._used[key] = document["used"]
+                return
+            except Exception as e:
+                self.write_log(f"CreditTracker: failed to persist credits of {client_id}: {e}")
+        with self._lock:
+            self._used[key] = self._used.get(key, 0) + count
+
+    # Method to count credits spent by an execute call.
+    async def record(self, client_id, count=1):
+        await asyncio.to_thread(self._increment, client_id, count)
+        self.schedule_sync(client_id)
+
+    # Method to replace the local count with the value from the credit-spent API.
+    async def sync(self, client_id):
+        try:
+            used = await self.fetch_used(client_id)
+            if used is None:
+                return
+            key = self._key(client_id)
+            with self._lock:
+                self._used[key] = used
+            if self.collection is not None:
+                await asyncio.to_thread(self.collection.update_one, {"_id": key}, {"$set": {"used": used, "syncedAt": datetime.now(timezone.utc)}}, upsert=True)
+            self.write_log(f"CreditTracker: synced {client_id} with {used} credits used")
+        except Exception as e:
+            self.write_log(f"CreditTracker: failed to sync credits of {client_id}: {e}")
+        finally:
+            with self._lock:
+                self._synced_at[client_id] = time.monotonic()
+                self._syncing.discard(client_id)
+
+    # Method to start a background resync if the last one is older than the interval.
+    def schedule_sync(self, client_id):
+        with self._lock:
+            synced_at = self._synced_at.get(client_id)
+            if client_id in self._syncing or (synced_at is not None and time.monotonic() - synced_at < self.sync_interval):
+                return
+            self._syncing.add(client_id)
+        task = asyncio.get_running_loop().create_task(self.sync(client_id))
+        # Keep a reference so the task is not garbage collected while it runs.
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    # Method to resync the clients forever, started with the app.
+    async def run(self, client_ids):
+        while True:
+            for client_id in client_ids:
+                self.schedule_sync(client_id)
+            await asyncio.sleep(self.sync_interval)
@@ -0,0 +1,101 @@
+"""
+Description: Request deadline carried through a context variable.
+A request starts a deadline once and every downstream call reads the remaining
+budget instead of using its own fixed timeout: the shared HTTP client bounds its
+requests with it, blocking calls run in a thread under it and MongoDB operations
+get it as their client-side timeout (sent to the server as maxTimeMS). When the
+budget runs out DeadlineExceeded is raised, so the request can answer with what
+it already has instead of hanging.
+"""
+
+import time
+import asyncio
+import contextlib
+from contextvars import ContextVar
+
+import pymongo
+from pymongo.errors import PyMongoError
+
+# time.monotonic() value at which the current request must answer.
+_deadline = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+# Method to start the deadline of the current request, returns a token for reset().
+def start(seconds):
+    return _deadline.set(time.monotonic() + seconds)
+
+
+# Method to restore the deadline that was in effect before start().
+def reset(token):
+    _deadline.reset(token)
+
+
+# Method to get the seconds left, None when there is no deadline.
+def remaining():
+    expires_at = _deadline.get()
+    if expires_at is None:
+        return None
+    return max(0.0, expires_at - time.monotonic())
+
+
+# Method to raise DeadlineExceeded when no budget is left.
+def check(stage="request"):
+    budget = remaining()
+    if budget is not None and budget <= 0:
+        raise DeadlineExceeded(f"Deadline exceeded before {stage}")
+
+
+# Method to get the smaller of a timeout and the remaining budget.
+def bounded(timeout=None):
+    budget = remaining()
+    if budget is None:
+        return timeout
+    return budget if timeout is None else min(timeout, budget)
+
+
+# Context manager giving the pymongo operations inside it the remaining budget.
+def mongo_timeout():
+    budget = remaining()
+    if budget is None:
+        return contextlib.nullcontext()
+    return pymongo.timeout(budget)
+
+
+# Method to await a coroutine within the remaining budget.
+async def wait(coroutine, stage="call"):
+    try:
+        check(stage)
+    except DeadlineExceeded:
+        coroutine.close()
+        raise
+    try:
+        return await asyncio.wait_for(coroutine, remaining())
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(f"Deadline exceeded during {stage}")
+
+
+# Method to await a MongoDB coroutine (see lib/async_mongo_db) within the remaining budget.
+async def mongo(coroutine, stage="mongo"):
+    try:
+        check(stage)
+    except DeadlineExceeded:
+        coroutine.close()
+        raise
+    with mongo_timeout():
+        try:
+            return await wait(coroutine, stage)
+        except PyMongoError as e:
+            if e.timeout:
+                raise DeadlineExceeded(f"Deadline exceeded during {stage}: {e}")
+            raise
+
+
+# Method to run a blocking call (usually MongoDB) in a thread within the remaining budget.
+async def call(function, *args, **kwargs):
+    stage = getattr(function, "__name__", "call")
+    # The thread gets a copy of this context, so pymongo sees the timeout too.
+    return await mongo(asyncio.to_thread(function, *args, **kwargs), stage)
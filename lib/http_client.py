@@ -0,0 +1,119 @@
+"""
+Description: Shared async HTTP client for every outbound service (JDoodle, Kod.so,
+QuickChart and the short link API). One httpx client per event loop keeps a pool of
+keep-alive connections per host, speaks HTTP/2 where the server supports it (when
+the h2 package is installed) and applies default timeouts, so calls reuse the TCP
+and TLS handshakes instead of paying them every time. Statistics per host and of
+the connection pool are available to tune the limits. Requests made under a request
+deadline (see lib/deadline) get at most the remaining budget.
+"""
+
+import time
+import asyncio
+import threading
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import httpx
+
+from config import Config
+from lib import deadline
+
+config = Config()
+
+try:
+    import h2  # noqa: F401
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+
+class HttpClient:
+    # Constructor to set the timeouts (seconds) and the connection pool limits.
+    def __init__(self, timeout=10, connect_timeout=5, max_connections=100, max_keepalive=20, keepalive_expiry=30, http2=HTTP2):
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive,
+                                   keepalive_expiry=keepalive_expiry)
+        self.http2 = http2
+        self._clients = {}
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    # Method to write logs to a file.
+    def write_log(self, log_msg: str):
+        try:
+            print(str(datetime.now()) + " " + log_msg)
+        except Exception as e:
+            print(str(e))
+
+    # Method to get the client of the running event loop, connections cannot move between loops.
+    def client(self, verify=True):
+        key = (id(asyncio.get_running_loop()), verify)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None or client.is_closed:
+                client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits, http2=self.http2, verify=verify)
+                self._clients[key] = client
+            return client
+
+    def _record(self, host, started, error):
+        with self._lock:
+            stats = self._hosts.setdefault(host, {"requests": 0, "errors": 0, "time": 0.0})
+            stats["requests"] += 1
+            stats["errors"] += error
+            stats["time"] += time.monotonic() - started
+
+    # Method to send a request, kwargs are the ones of httpx (params, data, json, content, headers, timeout...).
+    # Within a request deadline the call gets at most the remaining budget and raises DeadlineExceeded.
+    async def request(self, method, url, verify=True, **kwargs):
+        host = urlsplit(url).netloc
+        if deadline.remaining() is not None:
+            kwargs["timeout"] = deadline.bounded(kwargs.get("timeout", self.timeout.read))
+        started = time.monotonic()
+        try:
+            response = await deadline.wait(self.client(verify).request(method, url, **kwargs), f"request to {host}")
+        except BaseException:
+            self._record(host, started, True)
+            raise
+        self._record(host, started, response.status_code >= 500)
+        return response
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    # Method to get the request counters per host and the state of the connection pools.
+    def stats(self):
+        with self._lock:
+            hosts = {host: {"requests": stats["requests"], "errors": stats["errors"],
+                            "average_time": round(stats["time"] / stats["requests"], 4) if stats["requests"] else 0.0}
+                     for host, stats in self._hosts.items()}
+            clients = list(self._clients.values())
+        connections = {"total": 0, "idle": 0, "http2": 0}
+        for client in clients:
+            # httpcore keeps one pool with the connections of every host.
+            pool = getattr(client._transport, "_pool", None)
+            for connection in getattr(pool, "connections", []):
+                connections["total"] += 1
+                connections["idle"] += connection.is_idle()
+                connections["http2"] += "HTTP/2" in repr(connection)
+        return {"hosts": hosts, "connections": connections, "http2": self.http2,
+                "max_connections": self.limits.max_connections, "max_keepalive": self.limits.max_keepalive_connections}
+
+    # Method to close every client, called when the app stops.
+    async def aclose(self):
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                self.write_log(f"HttpClient: failed to close a client: {e}")
+
+
+# Client shared by every module.
+http_client = HttpClient(config.http_timeout, config.http_connect_timeout, config.http_max_connections,
+                         config.http_max_keepalive, config.http_keepalive_expiry)
@@ -1,10 +1,12 @@
 # JDoodle language codes.
 # Credit - https://sl.bing.net/jbo456vZ8Eu
 from datetime import datetime
+import os
 import random
 import string
 import json
-import requests
+
+from lib.http_client import http_client
 
 credit_spent_url = "https://api.jdoodle.com/v1/credit-spent"
 
@@ -64,10 +66,23 @@ def get_jdoodle_client_2():
     return client_id, client_secret
 
 
-def get_credits_used():
+# Method to get every JDoodle client ID and secret.
+# More clients are added with JDOODLE_CREDENTIALS="id1:secret1,id2:secret2".
+def get_jdoodle_credentials():
+    credentials = [get_jdoodle_client_1(), get_jdoodle_client_2()]
+    for credential in os.environ.get("JDOODLE_CREDENTIALS", "").split(","):
+        client_id, _, client_secret = credential.strip().partition(":")
+        if client_id and client_secret and client_id not in dict(credentials):
+            credentials.append((client_id, client_secret))
+    return credentials
+
+
+async def get_credits_used(client_id=None, client_secret=None):
     try:
         write_log("get_credits_used: called")
-        response = get_jdoodle_credit_spent()
+        response = await get_jdoodle_credit_spent(client_id, client_secret)
+        if response is None:
+            return None
         credit_spent = response.json()
         credits_used = 0
         write_log(f"get_credits_used response : {credit_spent}")
@@ -81,27 +96,11 @@ def get_credits_used():
         write_log("Exception in get_credits_used: " + str(e))
 
 
-# Method to get the JDoodle client.
-def get_jdoodle_client():
-    try:
-        index = 1
-        write_log(f"get_jdoodle_client: Getting jdoodle client {index}")
-        credits_used = get_credits_used()
-        if credits_used < 200:
-            write_log("get_jdoodle_client: return client_1")
-            return get_jdoodle_client_1()
-        else:
-            write_log("Credits exhaused for client_1")
-            write_log("get_jdoodle_client: return client_2")
-    except Exception as e:
-        write_log(f"get_jdoodle_client: {e}")
-        return get_jdoodle_client_2()
-
-
-# Method to call the JDoodle "credit-spent" API.
-def get_jdoodle_credit_spent():
+# Method to call the JDoodle "credit-spent" API, returns None if the request failed.
+async def get_jdoodle_credit_spent(client_id=None, client_secret=None):
     try:
-        client_id, client_secret = get_jdoodle_client_1()
+        if client_id is None:
+            client_id, client_secret = get_jdoodle_client_1()
         headers = {
             'Content-Type': 'application/json',
             'X-Requested-With': 'XMLHttpRequest',
@@ -109,8 +108,9 @@ def get_jdoodle_credit_spent():
 
         body = {"clientId": client_id, "clientSecret": client_secret}
         write_log(f"get_jdoodle_credit_spent: sending request with url {credit_spent_url}")
-        credit_spent = requests.post(credit_spent_url, headers=headers, data=json.dumps(body))
+        credit_spent = await http_client.post(credit_spent_url, headers=headers, content=json.dumps(body))
         write_log(f"get_jdoodle_credit_spent: {credit_spent}")
+        return credit_spent
     except Exception as e:
         write_log(f"get_jdoodle_credit_spent: {e}")
-    return credit_spent
+        return None
@@ -0,0 +1,134 @@
+"""
+Description: Pool of JDoodle credentials with load-aware scheduling and circuit breaking.
+Each credential tracks its remaining credits, in-flight requests, error rate and
+latency. Requests go to the credential with the lowest expected cost, and a
+credential that keeps failing is skipped until its circuit breaker lets a trial
+request through again. Capacity grows by adding keys.
+"""
+
+import time
+import threading
+from datetime import datetime, timezone
+
+# Weight of the newest sample in the moving averages.
+EWMA_ALPHA = 0.2
+
+
+class JDoodleCredential:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, client_id, client_secret, daily_limit=200):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.daily_limit = daily_limit
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.error_rate = 0.0
+        self.latency = None
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        # Set when JDoodle answers that the daily credits are used up.
+        self.exhausted_day = None
+
+    def stats(self, used):
+        return {
+            "client_id": self.client_id[:8] + "...",
+            "state": self.state,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "error_rate": round(self.error_rate, 4),
+            "latency": round(self.latency, 4) if self.latency is not None else None,
+            "credits_used": used,
+            "credits_remaining": max(0, self.daily_limit - used),
+        }
+
+
+class JDoodleClientPool:
+    # Constructor, credit_tracker gives the credits used per client (see CreditTracker).
+    def __init__(self, credentials, credit_tracker=None, daily_limit=200, failure_threshold=3, reset_timeout=60):
+        self.credentials = [JDoodleCredential(client_id, client_secret, daily_limit) for client_id, client_secret in credentials]
+        self.credit_tracker = credit_tracker
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+
+    # Method to write logs to a file.
+    def write_log(self, log_msg: str):
+        try:
+            print(str(datetime.now()) + " " + log_msg)
+        except Exception as e:
+            print(str(e))
+
+    def _used(self, credential):
+        return self.credit_tracker.used(credential.client_id) if self.credit_tracker else 0
+
+    @staticmethod
+    def _today():
+        return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+    def _available(self, credential, remaining, now):
+        if remaining <= 0 or credential.exhausted_day == self._today():
+            return False
+        if credential.state == JDoodleCredential.OPEN:
+            if now - credential.opened_at < self.reset_timeout:
+                return False
+            # Let one trial request through.
+            credential.state = JDoodleCredential.HALF_OPEN
+        if credential.state == JDoodleCredential.HALF_OPEN:
+            return credential.in_flight == 0
+        return True
+
+    # Lower is better: busy, slow, failing or nearly exhausted credentials cost more.
+    @staticmethod
+    def _cost(credential, remaining):
+        latency = credential.latency if credential.latency is not None else 0.5
+        remaining_share = remaining / credential.daily_limit
+        return (credential.in_flight + 1) * max(latency, 0.05) * (1 + 4 * credential.error_rate) / max(remaining_share, 0.01)
+
+    # Method to pick a credential for a request, returns None when none is usable.
+    # Blocks on the first call of the day while the credit counters are loaded.
+    def acquire(self, exclude=()):
+        remaining = {credential.client_id: credential.daily_limit - self._used(credential) for credential in self.credentials}
+        now = time.monotonic()
+        with self._lock:
+            candidates = [credential for credential in self.credentials
+                          if credential.client_id not in exclude and self._available(credential, remaining[credential.client_id], now)]
+            if not candidates:
+                return None
+            credential = min(candidates, key=lambda candidate: self._cost(candidate, remaining[candidate.client_id]))
+            credential.in_flight += 1
+            credential.requests += 1
+            return credential
+
+    # Method to report how a request on the credential went.
+    # success is None for a request abandoned by the caller, which says nothing about the credential.
+    def release(self, credential, success, latency=None, exhausted=False):
+        with self._lock:
+            credential.in_flight -= 1
+            if success is None:
+                return
+            if latency is not None:
+                credential.latency = latency if credential.latency is None else (1 - EWMA_ALPHA) * credential.latency + EWMA_ALPHA * latency
+            credential.error_rate = (1 - EWMA_ALPHA) * credential.error_rate + EWMA_ALPHA * (0.0 if success else 1.0)
+            if exhausted:
+                credential.exhausted_day = self._today()
+                self.write_log(f"JDoodleClientPool: credits exhausted for {credential.client_id[:8]}")
+            if success:
+                credential.consecutive_failures = 0
+                credential.state = JDoodleCredential.CLOSED
+                return
+            credential.failures += 1
+            credential.consecutive_failures += 1
+            if credential.state == JDoodleCredential.HALF_OPEN or credential.consecutive_failures >= self.failure_threshold:
+                credential.state = JDoodleCredential.OPEN
+                credential.opened_at = time.monotonic()
+                self.write_log(f"JDoodleClientPool: circuit opened for {credential.client_id[:8]}")
+
+    # Method to get the statistics of every credential.
+    def stats(self):
+        used = {credential.client_id: self._used(credential) for credential in self.credentials}
+        with self._lock:
+            return [credential.stats(used[credential.client_id]) for credential in self.credentials]
@@ -5,11 +5,12 @@ Server API : REST.
 Website : https://kod.so/
 """
 
-import requests
 from datetime import datetime
 import random
 from urllib.parse import quote
 from config import Config
+from lib.http_client import http_client
+from lib.deadline import DeadlineExceeded
 
 config = Config()
 
@@ -56,41 +57,43 @@ class Kodso:
 		except Exception as e:
 			print(str(e))
 
-	def generate_snippet(self, code: str, **kwargs):
+	async def generate_snippet(self, code: str, **kwargs):
 		try:
 			self.write_log(f"generate_snippet: method with code and kwargs: {kwargs}")
-			# Update the default parameters with any additional parameters provided by the user
-			self.params.update(kwargs)
-			self.params['code'] = code
+			# Copy the default parameters with the ones provided by the user, concurrent calls must not share them
+			params = dict(self.params, **kwargs)
+			params['code'] = code
 
 			# Add the code parameter
 			self.write_log(f"generate_snippet: starting request to Kod.so API")
 			# Send the request to the Kod.so API
-			response = requests.get(self.api_url, headers=self.headers, params=self.params, verify=False)
+			response = await http_client.get(self.api_url, headers=self.headers, params=params, verify=False, follow_redirects=True)
 
 			self.write_log(f"generate_snippet: request to Kod.so API completed")
 
 			if response.status_code == 200:
 				# If successful, returns the URL of the generated code snippet
 				self.write_log(f"generate_snippet: method successful")
-				return response.url
+				return str(response.url)
 
 			else:
 				self.write_log(f"generate_snippet: An error occurred while generating the code: {response.text}")
 				return {"output": "An error occurred while generating the code."}
 
+		except DeadlineExceeded:
+			raise
 		except Exception as e:
 			self.write_log(f"generate_snippet: An error occurred while generating the code: {e}")
 			return {"output": "An error occurred while generating the code."}
 
-	def show_snippet(self, code: str, **kwargs):
+	async def show_snippet(self, code: str, **kwargs):
 		try:
 			self.write_log(f"save_snippet: method with code and kwargs: {kwargs}")
 			# Generate a random filename for the image
 			filename = f"snippet_{random.randint(1, 10000)}.png"
 
 			# Generate the URL of the code snippet
-			code_url = self.generate_snippet(code, **kwargs)
+			code_url = await self.generate_snippet(code, **kwargs)
 
 			if not code_url:
 				self.write_log(f"save_snippet: method failed to generate code_url")
@@ -103,6 +106,8 @@ class Kodso:
 			download_svg_url = code_url + "&output=svg&download=1"
 			return code_url, download_png_url, download_jpg_url, download_svg_url
 
+		except DeadlineExceeded:
+			raise
 		except Exception as e:
 			self.write_log(f"An error occurred while saving the code snippet to the database: {e}")
 		return {"output": "An error occurred while saving the code snippet to the database."}
@@ -0,0 +1,44 @@
+"""
+Description: Exec wrapper applying rlimits to a command before running it.
+run_process starts programs through this script instead of a preexec_fn, which is not
+safe to run in a child forked from a process with threads. The script only imports
+modules of the standard library and replaces itself with the command, so the limits
+apply to the command and to everything it starts.
+
+Usage: python -S lib/limit_exec.py '{"cpu": 5, "memory": 268435456}' command [args...]
+"""
+
+import os
+import sys
+import json
+import resource
+
+LIMITS = {
+    "cpu": resource.RLIMIT_CPU,
+    "memory": resource.RLIMIT_AS,
+    "files": resource.RLIMIT_NOFILE,
+    "file_size": resource.RLIMIT_FSIZE,
+}
+
+
+# Method to apply the limits to the current process.
+def apply_limits(limits):
+    for name, limit in LIMITS.items():
+        value = limits.get(name)
+        if value:
+            # The hard CPU limit is one second later so the program gets SIGXCPU first.
+            resource.setrlimit(limit, (value, value + 1 if name == "cpu" else value))
+
+
+def main(argv):
+    apply_limits(json.loads(argv[1]))
+    try:
+        os.execvp(argv[2], argv[2:])
+    except OSError as e:
+        sys.stderr.write(f"{argv[2]}: {e.strerror}\n")
+        sys.stderr.flush()
+        os._exit(127)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,311 @@
+"""
+Description: Local execution backends for the languages otherwise sent to JDoodle.
+A backend writes the code into a temporary directory, compiles it when the language
+needs it and runs it in a subprocess of its own session with rlimits on CPU time,
+address space, open files and file size, a minimal environment and a deadline after
+which the whole process group is killed. The rlimits are applied by lib/limit_exec.py,
+which replaces itself with the program. There is no filesystem or network isolation,
+so run_code only uses these backends when local routing is enabled in the config.
+Backends register themselves by JDoodle language code and are only used when their
+toolchain is installed, so run_code can fall back to JDoodle. Responses have the same
+shape as the JDoodle execute API.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import signal
+import asyncio
+import tempfile
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Bytes read from a running program at a time.
+READ_CHUNK_SIZE = 64 * 1024
+
+# Build cache shared by the Go compilations, the standard library is built only once.
+GO_CACHE_DIR = os.path.join(tempfile.gettempdir(), "code-runner-go-cache")
+
+
+# Method to write logs to a file.
+def write_log(log_msg: str):
+    try:
+        print(str(datetime.now()) + " " + log_msg)
+    except Exception as e:
+        print(str(e))
+
+
+# Wrapper applying the rlimits right before exec, see lib/limit_exec.py.
+LIMIT_EXEC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "limit_exec.py")
+
+# Limits applied through setrlimit, the output limit is enforced while reading.
+RLIMITS = ("cpu", "memory", "files", "file_size")
+
+
+# Method to prefix the command with the exec wrapper when it has rlimits to apply.
+def _limited_command(command, limits):
+    rlimits = {key: limits[key] for key in RLIMITS if limits.get(key)}
+    if resource is None or not rlimits:
+        return list(command)
+    return [sys.executable, "-S", "-E", LIMIT_EXEC, json.dumps(rlimits), *command]
+
+
+# Method to describe how a program ended when it failed.
+def _exit_error(returncode):
+    if returncode < 0:
+        number = -returncode
+        if number == signal.SIGXCPU:
+            return "CPU time limit exceeded"
+        if number == signal.SIGXFSZ:
+            return "File size limit exceeded"
+        return f"Program was killed by signal {signal.Signals(number).name}"
+    if returncode:
+        return f"Program exited with status {returncode}"
+    return None
+
+
+def _kill_group(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+# Method to run a command in a sandboxed subprocess, stdout and stderr are merged like on JDoodle.
+async def run_process(command, cwd, stdin=None, timeout=30, limits=None, env=None):
+    limits = limits or {}
+    output_limit = limits.get("output")
+    started = time.monotonic()
+    process = await asyncio.create_subprocess_exec(
+        *_limited_command(command, limits), cwd=cwd, env=env,
+        stdin=asyncio.subprocess.PIPE if stdin is not None else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+        start_new_session=True)
+
+    output = bytearray()
+    result = {"timed_out": False, "error": None}
+
+    async def feed():
+        try:
+            process.stdin.write(stdin.encode("utf-8"))
+            await process.stdin.drain()
+            process.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            # The program exited without reading all of its input.
+            pass
+
+    async def read():
+        while True:
+            chunk = await process.stdout.read(READ_CHUNK_SIZE)
+            if not chunk:
+                return
+            output.extend(chunk)
+            if output_limit and len(output) > output_limit:
+                del output[output_limit:]
+                result["error"] = f"Output limit of {output_limit} bytes exceeded"
+                _kill_group(process)
+                return
+
+    try:
+        steps = [read(), process.wait()]
+        if stdin is not None:
+            steps.append(feed())
+        await asyncio.wait_for(asyncio.gather(*steps), timeout)
+    except asyncio.TimeoutError:
+        result["timed_out"] = True
+        result["error"] = f"Execution timed out after {round(timeout, 1)} seconds"
+    finally:
+        # Also kill whatever the program left running in its session.
+        _kill_group(process)
+        await process.wait()
+
+    result["output"] = output.decode("utf-8", "replace")
+    result["exit_code"] = process.returncode
+    result["time"] = round(time.monotonic() - started, 3)
+    if result["error"] is None:
+        result["error"] = _exit_error(process.returncode)
+    return result
+
+
+class Program:
+    # Constructor, a program that is compiled (or written, for scripts) and ready to run.
+    def __init__(self, backend, workdir, command, env):
+        self.backend = backend
+        self.workdir = workdir
+        self.command = command
+        self.env = env
+        # Whether the artifacts came from the artifact cache.
+        self.cached = False
+
+    # Method to run the program once with the given stdin.
+    async def run(self, stdin=None, timeout=30, limits=None):
+        limits = dict(limits or {})
+        if not self.backend.limit_memory:
+            limits.pop("memory", None)
+        return await run_process(self.command, self.workdir, stdin, timeout, limits, self.env)
+
+    # Method to remove the working directory of the program.
+    def close(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class CompileError(Exception):
+    def __init__(self, result):
+        super().__init__(result["error"] if result["timed_out"] else "Compilation failed")
+        self.result = result
+
+
+class LocalBackend:
+    # Constructor, the commands are lists formatted with {source}, {binary}, {workdir} and {main}.
+    def __init__(self, language_code, extension, run_command, compile_command=None, tools=None, limit_memory=True, env=None):
+        self.language_code = language_code
+        self.extension = extension
+        self.run_command = run_command
+        self.compile_command = compile_command
+        # Executables that must be installed for the backend to be used.
+        self.tools = tools or [(compile_command or run_command)[0]]
+        # Runtimes reserving a lot of address space (Go, Node, JVM) only get the other limits.
+        self.limit_memory = limit_memory
+        self.env = env or {}
+        self._available = None
+        self._compiler_id = None
+
+    # Method to check once whether the toolchain is installed.
+    def available(self):
+        if self._available is None:
+            self._available = all(shutil.which(tool) for tool in self.tools)
+        return self._available
+
+    # Name of the source file without extension.
+    def main_name(self, script):
+        return "main"
+
+    def _environment(self, workdir):
+        env = {"PATH": os.environ.get("PATH", "/usr/local/bin:/usr/bin:/bin"), "HOME": workdir,
+               "TMPDIR": workdir, "LANG": "C.UTF-8"}
+        env.update(self.env)
+        return env
+
+    def _format(self, command, workdir, main):
+        values = {"source": f"{main}.{self.extension}", "binary": os.path.join(workdir, main), "workdir": workdir, "main": main}
+        return [part.format(**values) for part in command]
+
+    # Identity of the installed compiler, so upgrading it invalidates the cached artifacts.
+    def compiler_id(self):
+        if self._compiler_id is None:
+            path = shutil.which(self.compile_command[0])
+            self._compiler_id = f"{os.path.realpath(path)}:{os.path.getmtime(path)}" if path else ""
+        return self._compiler_id
+
+    # Method to write and compile the code, raises CompileError with the compiler output.
+    # With an artifact cache the compiler only runs for code it has not compiled before.
+    async def prepare(self, script, timeout=30, limits=None, artifact_cache=None):
+        workdir = tempfile.mkdtemp(prefix=f"run-{self.language_code}-")
+        main = self.main_name(script)
+        env = self._environment(workdir)
+        source = f"{main}.{self.extension}"
+        cached = False
+        try:
+            with open(os.path.join(workdir, source), "w", encoding="utf-8") as file:
+                file.write(script)
+            if self.compile_command:
+                cache_key = None
+                if artifact_cache:
+                    cache_key = artifact_cache.key(self.language_code, self.compiler_id(), self.compile_command, main, script)
+                    cached = await asyncio.to_thread(artifact_cache.get, cache_key, workdir)
+                if not cached:
+                    # Compilers only get the CPU time and output limits, they write big objects and map a lot of memory.
+                    compile_limits = {key: value for key, value in (limits or {}).items() if key in ("cpu", "output")}
+                    result = await run_process(self._format(self.compile_command, workdir, main), workdir, None, timeout, compile_limits, env)
+                    if result["exit_code"] != 0 or result["timed_out"]:
+                        raise CompileError(result)
+                    if cache_key:
+                        artifacts = [name for name in os.listdir(workdir) if name != source]
+                        await asyncio.to_thread(artifact_cache.put, cache_key, workdir, artifacts)
+        except BaseException:
+            shutil.rmtree(workdir, ignore_errors=True)
+            raise
+        program = Program(self, workdir, self._format(self.run_command, workdir, main), env)
+        program.cached = cached
+        return program
+
+    # Method to run the code like the JDoodle execute API would.
+    async def execute(self, script, stdin=None, compile_only=False, timeout=30, limits=None, artifact_cache=None):
+        deadline = time.monotonic() + timeout
+        try:
+            program = await self.prepare(script, timeout, limits, artifact_cache)
+        except CompileError as e:
+            return self._response(e.result, compiled=False)
+        try:
+            # Compiling only still fills the artifact cache for the runs that follow.
+            if compile_only:
+                response = self._response({"output": "", "exit_code": 0, "timed_out": False, "error": None, "time": 0}, compiled=True)
+            else:
+                remaining = max(0.1, deadline - time.monotonic())
+                response = self._response(await program.run(stdin, remaining, limits), compiled=True)
+            if self.compile_command and artifact_cache:
+                response["compile_cache"] = "hit" if program.cached else "miss"
+            return response
+        finally:
+            program.close()
+
+    def _response(self, result, compiled):
+        output = result["output"]
+        # A plain non-zero exit status is left to the output, like on JDoodle.
+        if result["error"] and (result["timed_out"] or result["exit_code"] < 0):
+            output += ("\n" if output else "") + result["error"]
+        return {
+            "output": output,
+            "statusCode": 200,
+            "memory": None,
+            "cpuTime": str(result["time"]),
+            "isCompiled": compiled,
+            "isExecutionSuccess": compiled and result["exit_code"] == 0,
+            "timed_out": result["timed_out"],
+            "backend": "local",
+        }
+
+
+class JavaBackend(LocalBackend):
+    # The source file must be named after the public class.
+    def main_name(self, script):
+        match = re.search(r"public\s+(?:final\s+|abstract\s+)*class\s+(\w+)", script)
+        return match.group(1) if match else "Main"
+
+
+# Registry of the backends by JDoodle language code.
+BACKENDS = {}
+
+
+# Method to add a backend to the registry, replacing any backend of the same language.
+def register_backend(backend):
+    BACKENDS[backend.language_code] = backend
+    return backend
+
+
+# Method to get the installed backend of a language, returns None to fall back to JDoodle.
+def get_backend(language_code):
+    backend = BACKENDS.get(language_code)
+    if backend is None or not backend.available():
+        return None
+    return backend
+
+
+register_backend(LocalBackend("c", "c", ["{binary}"], ["gcc", "-O2", "-pipe", "-o", "{binary}", "{source}", "-lm"]))
+register_backend(LocalBackend("cpp14", "cpp", ["{binary}"], ["g++", "-O2", "-pipe", "-std=c++14", "-o", "{binary}", "{source}"]))
+register_backend(LocalBackend("cpp17", "cpp", ["{binary}"], ["g++", "-O2", "-pipe", "-std=c++17", "-o", "{binary}", "{source}"]))
+register_backend(LocalBackend("go", "go", ["{binary}"], ["go", "build", "-o", "{binary}", "{source}"],
+                              limit_memory=False, env={"GOCACHE": GO_CACHE_DIR, "GO111MODULE": "off", "CGO_ENABLED": "0"}))
+register_backend(LocalBackend("nodejs", "js", ["node", "{source}"], limit_memory=False))
+register_backend(LocalBackend("bash", "sh", ["bash", "{source}"]))
+register_backend(JavaBackend("java", "java", ["java", "-Xmx256m", "-cp", "{workdir}", "{main}"], ["javac", "-d", "{workdir}", "{source}"],
+                             tools=["javac", "java"], limit_memory=False))
+register_backend(LocalBackend("swift", "swift", ["{binary}"], ["swiftc", "-O", "-o", "{binary}", "{source}"]))
+register_backend(LocalBackend("r", "r", ["Rscript", "{source}"]))
@@ -7,15 +7,86 @@ from datetime import datetime
 from dotenv import load_dotenv
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
-from gridfs import GridFS
+from gridfs import GridFS, GridFSBucket, NoFile
 from typing import Optional
 import base64
+from bson import ObjectId
+from bson.errors import InvalidId
 from config import Config
 
 config = Config()
 plugin_url = config.proxydomain
 dataset = config.dbname
 
+# GridFS buckets of the database.
+GRIDFS_BUCKETS = ["graphs", "codes", "docs", "img", "users", "snippets", "outputs"]
+
+# Collection of the filename -> bucket catalog, so /download finds a file with one lookup.
+FILE_CATALOG = "file_catalog"
+
+# Indexes provisioned at startup, collection -> list of (keys, options).
+INDEXES = {
+    "codes": [([("filename", 1)], {}), ([("id", 1)], {})],
+    "users": [([("id", 1)], {})],
+    FILE_CATALOG: [([("filename", 1)], {"unique": True})],
+}
+# Same key as the index the GridFS drivers create, so it is not created twice.
+INDEXES.update({f"{bucket}.files": [([("filename", 1), ("uploadDate", 1)], {})] for bucket in GRIDFS_BUCKETS})
+
+
+# Buckets that can be listed, in listing order ("codes" is the collection of saved codes, the others GridFS buckets).
+LISTED_BUCKETS = ["codes", "graphs", "docs", "img", "snippets", "outputs"]
+# Buckets listed when none is asked for, the ones list_all_collections always returned.
+DEFAULT_LISTED_BUCKETS = ["codes", "graphs", "docs"]
+
+
+# Method to get the collection holding the filenames of a listed bucket, chunk collections are never read.
+def listing_collection(bucket):
+    return "codes" if bucket == "codes" else f"{bucket}.files"
+
+
+# Method to build the query of a listing page. The _id of a document is an ObjectId holding its
+# creation time, so the time range and the page cursor are both ranges on the _id index.
+def listing_query(since=None, until=None, after=None):
+    id_range = {}
+    if since is not None:
+        id_range["$gte"] = ObjectId.from_datetime(since)
+    if until is not None:
+        id_range["$lt"] = ObjectId.from_datetime(until)
+    if after is not None:
+        id_range["$gt"] = after
+    query = {"filename": {"$exists": True}}
+    if id_range:
+        query["_id"] = id_range
+    return query
+
+
+# Method to encode the position after the last listed file as an opaque page cursor.
+def encode_cursor(bucket, last_id):
+    return base64.urlsafe_b64encode(f"{bucket}:{last_id}".encode()).decode()
+
+
+# Method to decode a page cursor into (bucket, last_id), raises ValueError when it is invalid.
+def decode_cursor(cursor):
+    try:
+        bucket, last_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        if bucket not in LISTED_BUCKETS:
+            raise ValueError(bucket)
+        return bucket, ObjectId(last_id)
+    except (ValueError, InvalidId, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+# Method to get the indexes of INDEXES missing from the index information of each collection.
+def missing_indexes(index_information):
+    missing = []
+    for collection, indexes in INDEXES.items():
+        existing = [[tuple(key) for key in index["key"]] for index in index_information.get(collection, {}).values()]
+        for keys, options in indexes:
+            if [tuple(key) for key in keys] not in existing:
+                missing.append(f"{collection}: {keys}")
+    return missing
+
 
 # Creating MongoDB connector class
 class MongoDB:
@@ -42,6 +113,7 @@ class MongoDB:
         self.img = GridFS(self.db, "img")
         self.users = GridFS(self.db, "users")
         self.snippets = GridFS(self.db, "snippets")
+        self.outputs = GridFS(self.db, "outputs")
 
     def _connect(self):
         # Connecting to the database using the URI
@@ -149,28 +221,16 @@ class MongoDB:
             return None
 
     def find_code(self, filename: str) -> Optional[dict]:
-        # Finding code in the codes collection
+        # Finding code in the codes collection, one query on the filename index returning only the script
         try:
-            code_id = self._find_code_id_by_filename(filename)
-            self.write_log(f"Found code with id {code_id} for filename {filename}")
-            filter = {"id": code_id}
-            response = self._find_data(filter, "codes")
-            if response:
-                self.write_log(f"Found code response: {response}")
-                code = response['script']
-                if code:
-                    self.write_log(f"Found {code} with id {code_id}")
-                    return code
-                else:
-                    self.write_log(f"Code with id {code_id} not found")
-                    return None
-            else:
-                self.write_log(f"No code found with id {code_id}")
-                response = None
-            self.write_log(f"Found code with id {code_id}")
-            return response
+            response = self.db["codes"].find_one({"filename": filename}, {"script": 1, "_id": 0})
+            if response and response.get("script"):
+                self.write_log(f"Found code with filename {filename}")
+                return response["script"]
+            self.write_log(f"No code found with filename {filename}")
+            return None
         except Exception as e:
-            self.write_log(f"Error while finding code with id {code_id}: {e}")
+            self.write_log(f"Error while finding code with filename {filename}: {e}")
             return None
 
     def _find_code_id_by_filename(self, filename: str) -> Optional[dict]:
@@ -214,66 +274,79 @@ class MongoDB:
             return None
 
     def save_image(self, image_path: str, image_id: str) -> Optional[str]:
-        # Storing an image in the graphs collection
+        # Storing an image in the graphs GridFS bucket, the file is read and written one chunk at a time
         try:
+            bucket = GridFSBucket(self.db, bucket_name="graphs", chunk_size_bytes=config.image_chunk_size)
             with open(image_path, "rb") as f:
-                image_data = f.read()
-                encoded_image = base64.b64encode(image_data).decode("utf-8")
-                document = {"image": encoded_image, "id": image_id, "timestamp": datetime.now()}
-                file_id = self._add_data(document, "graphs")
-                if file_id:
-                    self.write_log(f"Stored image response: {file_id}")
-                    file_id = str(file_id)  # convert ObjectId to string
-                else:
-                    self.write_log(f"Failed to store image {image_path}")
-                    file_id = None
-                self.write_log(f"Stored image {image_path} with id {file_id}")
-                return file_id
+                file_id = bucket.upload_from_stream(image_id, f, metadata={"id": image_id, "timestamp": datetime.now()})
+            self.register_file(image_id, "graphs", file_id)
+            file_id = str(file_id)  # convert ObjectId to string
+            self.write_log(f"Stored image {image_path} with id {file_id}")
+            return file_id
         except Exception as e:
             self.write_log(f"Failed to store image {image_path}: {e}")
             raise e
 
     def download_image(self, image_id: str, download_path: str) -> Optional[str]:
-        # Downloading an image from the graphs collection
+        # Downloading an image from the graphs GridFS bucket, one chunk at a time
         try:
-            filter = {"id": image_id}
-            document = self._find_data(filter, "graphs")
-            if document:
-                self.write_log("Found image in with id {image_id}")
-                with open(download_path, "wb") as f:
-                    image_data = document["image"]
-                    if image_data:
-                        image_data = base64.b64decode(image_data)
-                        f.write(image_data)
-                        self.write_log(f"Downloaded image {image_id} to {download_path}")
-                        return download_path
-                    else:
-                        self.write_log(f"Image with id {image_id} not found")
-                        return None
-            else:
-                self.write_log(f"No image found with id {image_id}")
-                return None
+            bucket = GridFSBucket(self.db, bucket_name="graphs")
+            with open(download_path, "wb") as f:
+                bucket.download_to_stream_by_name(image_id, f)
+            self.write_log(f"Downloaded image {image_id} to {download_path}")
+            return download_path
+        except NoFile:
+            os.remove(download_path)
+            return self._download_legacy_image(image_id, download_path)
         except Exception as e:
             self.write_log(f"Failed to download image {image_id}: {e}")
             raise e
 
+    # Images saved before GridFS are base64 documents of the graphs collection (see tools/migrate_images.py).
+    def _download_legacy_image(self, image_id: str, download_path: str) -> Optional[str]:
+        document = self._find_data({"id": image_id}, "graphs")
+        if not document or not document.get("image"):
+            self.write_log(f"No image found with id {image_id}")
+            return None
+        with open(download_path, "wb") as f:
+            f.write(base64.b64decode(document["image"]))
+        self.write_log(f"Downloaded legacy image {image_id} to {download_path}")
+        return download_path
+
     def delete_image(self, image_id: str) -> Optional[bool]:
-        # Deleting an image from the graphs collection
+        # Deleting an image from the graphs bucket and its legacy document if there is one
         try:
-            filter = {"id": image_id}
-            result = self._delete_data(filter, "graphs")
-            if result:
-                self.write_log(f"Deleted image response: {result}")
-                result = int(result) > 0
-            else:
-                self.write_log(f"No image found with id {image_id}")
-                result = False
+            bucket = GridFSBucket(self.db, bucket_name="graphs")
+            deleted = 0
+            for file in self.db["graphs.files"].find({"filename": image_id}, {"_id": 1}):
+                bucket.delete(file["_id"])
+                deleted += 1
+            deleted += self._delete_data({"id": image_id}, "graphs")
             self.write_log(f"Deleted image {image_id}")
-            return result
+            return deleted > 0
         except Exception as e:
             self.write_log(f"Failed to delete image {image_id}: {e}")
             raise e
 
+    # Method to open a GridFS upload stream for script output that is too large to return inline.
+    def open_output_stream(self, filename: str):
+        bucket = GridFSBucket(self.db, bucket_name="outputs")
+        self.write_log(f"Opening output stream for {filename}")
+        stream = bucket.open_upload_stream(filename, metadata={"contentType": "text/plain", "timestamp": datetime.now()})
+        self.register_file(filename, "outputs", stream._id)
+        return stream
+
+    # Method to record in which bucket a GridFS file is stored, when the file catalog is on.
+    def register_file(self, filename: str, bucket: str, file_id):
+        if not config.file_catalog:
+            return
+        try:
+            self.db[FILE_CATALOG].update_one({"filename": filename},
+                                             {"$set": {"bucket": bucket, "file_id": file_id, "timestamp": datetime.now()}},
+                                             upsert=True)
+        except Exception as e:
+            self.write_log(f"Failed to register {filename} in the file catalog: {e}")
+
     # method to get total number of documents in a collection
     def _get_total_documents(self, collection):
         try:
@@ -286,7 +359,7 @@ class MongoDB:
         return self._get_total_documents("codes")
 
     def get_total_images(self):
-        return self._get_total_documents("graphs")
+        return self._get_total_documents("graphs.files") + self._get_total_documents("graphs")
 
     # method to delete all documents in a collection
     def _delete_all_documents(self, collection):
@@ -315,25 +388,20 @@ class MongoDB:
         self.delete_all_documents()
         self.write_log("Resetting database to initial state")
 
-    # method to list contents of a collection
+    # method to list the filenames of a collection, only the filename is read
     def _list_all_files(self, collection):
         try:
-            return self.db[collection].find()
+            return self.db[collection].find({"filename": {"$exists": True}}, {"filename": 1, "_id": 0})
         except Exception as e:
             self.write_log(f"Failed to list contents of {collection}: {e}")
             raise e
 
     def list_all_collections(self):
-        # append all collections to a list
+        # append all collections to a list, chunk collections hold no filenames
         data_list = []
-        collections = ["codes", "graphs.files", "graphs.chunks", "docs.files", "docs.chunks"]
-        for collection in collections:
-            cursor = self._list_all_files(collection)
-            for item in cursor:
-                filename = item.get("filename")
-                if filename:
-                    filename = f'{plugin_url}/download/' + filename
-                    data_list.append({"filename": filename})
+        for bucket in DEFAULT_LISTED_BUCKETS:
+            for item in self._list_all_files(listing_collection(bucket)):
+                data_list.append({"filename": f'{plugin_url}/download/' + item["filename"]})
         return data_list
 
     # Method to restore deleted documents
@@ -0,0 +1,86 @@
+"""
+Description: Bounded capture of the output printed by a script.
+Up to `limit` characters are kept in memory. Past that the whole output is written
+to a spill stream (a GridFS file) and only the head and a ring buffer with the tail
+are kept, so memory per run stays bounded however much the script prints.
+"""
+
+from collections import deque
+from datetime import datetime
+
+
+class OutputCapture:
+    # Constructor, open_spill is a callable returning a writable binary stream or None to drop the middle.
+    def __init__(self, limit=1024 * 1024, preview=4096, open_spill=None):
+        self.limit = limit
+        self.preview = preview
+        self.open_spill = open_spill
+        self.total = 0
+        self.spilled = False
+        self._buffer = []
+        self._head = ""
+        self._tail = deque()
+        self._tail_size = 0
+        self._spill = None
+
+    # Method to write logs to a file.
+    def write_log(self, log_msg: str):
+        try:
+            print(str(datetime.now()) + " " + log_msg)
+        except Exception as e:
+            print(str(e))
+
+    def write(self, text):
+        self.total += len(text)
+        if not self.spilled:
+            self._buffer.append(text)
+            if self.total > self.limit:
+                self._start_spill()
+            return len(text)
+
+        if self._spill is not None:
+            self._spill.write(text.encode("utf-8"))
+        self._append_tail(text)
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def _start_spill(self):
+        text = "".join(self._buffer)
+        self._buffer = []
+        self.spilled = True
+        if self.open_spill is not None:
+            try:
+                self._spill = self.open_spill()
+                self._spill.write(text.encode("utf-8"))
+            except Exception as e:
+                self.write_log(f"OutputCapture: failed to spill output: {e}")
+                self._spill = None
+        self._head = text[:self.preview]
+        self._append_tail(text[-self.preview:])
+
+    # Keep only the last `preview` characters.
+    def _append_tail(self, text):
+        self._tail.append(text)
+        self._tail_size += len(text)
+        while self._tail_size - len(self._tail[0]) >= self.preview:
+            self._tail_size -= len(self._tail.popleft())
+
+    def getvalue(self):
+        if not self.spilled:
+            return "".join(self._buffer)
+        tail = "".join(self._tail)[-self.preview:]
+        skipped = self.total - len(self._head) - len(tail)
+        return f"{self._head}\n... [{skipped} characters truncated] ...\n{tail}"
+
+    # Method to finish the spill stream, returns True if the full output was stored.
+    def close(self):
+        if self._spill is None:
+            return False
+        try:
+            self._spill.close()
+            return True
+        except Exception as e:
+            self.write_log(f"OutputCapture: failed to close spill stream: {e}")
+            return False
@@ -1,15 +1,72 @@
 import io
+import sys
 import contextlib
 
-# Method to execute the code using exec.
-def execute_code(code):
-    # Create a string buffer to store the output
-    buffer = io.StringIO()
-    # Redirect the standard output to the buffer
-    with contextlib.redirect_stdout(buffer):
-        # Execute the code as Python code
-        exec(code)
-    # Get the output from the buffer
-    output = buffer.getvalue()
-    # Return the output as a string
-    return output
+# Image formats the figures can be saved in.
+GRAPH_FORMATS = {"png": "image/png", "svg": "image/svg+xml", "webp": "image/webp"}
+
+
+# Method to render every open matplotlib figure, returns the images as bytes.
+# compression is the PNG zlib level (0-9), quality the WebP quality (1-100).
+def render_graphs(format="png", dpi=None, compression=None, quality=None):
+    import matplotlib.pyplot as plt
+    images = []
+    for number in plt.get_fignums():
+        options = {"format": format}
+        if dpi:
+            options["dpi"] = dpi
+        if format == "png" and compression is not None:
+            options["pil_kwargs"] = {"compress_level": compression}
+        elif format == "webp" and quality is not None:
+            options["pil_kwargs"] = {"quality": quality}
+        buffer = io.BytesIO()
+        plt.figure(number).savefig(buffer, **options)
+        images.append(buffer.getvalue())
+    return images
+
+
+# Method to close all open matplotlib figures so they do not leak into the next script.
+def close_graphs():
+    try:
+        import sys
+        if 'matplotlib.pyplot' in sys.modules:
+            sys.modules['matplotlib.pyplot'].close('all')
+    except Exception:
+        pass
+
+
+# Method to run a script in a fresh namespace and collect stdout, stderr and the graphs.
+# capture_graph is None or the render_graphs options used to save every open figure.
+# When stdout/stderr streams are passed the output is written to them instead of being collected.
+def run_script(code, capture_graph=None, stdout=None, stderr=None, stdin=None):
+    streamed = stdout is not None
+    stdout = stdout if stdout is not None else io.StringIO()
+    stderr = stderr if stderr is not None else io.StringIO()
+    result = {"output": "", "stderr": "", "error": None, "graphs": []}
+    # Every script gets its own globals so reused workers do not share state.
+    scope = {"__name__": "__main__", "__builtins__": __builtins__}
+    # input() reads the given text, or hits EOF right away.
+    previous_stdin = sys.stdin
+    sys.stdin = io.StringIO(stdin or "")
+    try:
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            exec(code, scope)
+        if capture_graph:
+            result["graphs"] = render_graphs(**capture_graph)
+    except SystemExit as e:
+        # exit() inside the script only stops the script.
+        if e.code not in (None, 0):
+            result["error"] = f"Script exited with status {e.code}"
+    except Exception as e:
+        # Some exceptions like MemoryError have no message.
+        result["error"] = str(e) or e.__class__.__name__
+    finally:
+        sys.stdin = previous_stdin
+        close_graphs()
+    if streamed:
+        stdout.flush()
+        stderr.flush()
+    else:
+        result["output"] = stdout.getvalue()
+        result["stderr"] = stderr.getvalue()
+    return result
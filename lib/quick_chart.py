@@ -6,13 +6,16 @@ Server API : REST.
 Website : "https://quickchart.io"
 """
 
-import requests
 import json
 import random
+import httpx
 from datetime import datetime
 import gridfs
 
 import config
+from lib.http_client import http_client
+from lib import deadline
+from lib.deadline import DeadlineExceeded
 
 
 class QuickChartIO:
@@ -25,8 +28,12 @@ class QuickChartIO:
         self.database = database
         self.write_log("QuickChartIO: initialized")
 
+    # Method to get the QuickChart URL rendering the chart directly.
+    def chart_url(self, chart_type: str, data: dict):
+        return str(httpx.URL(self.base_url, params={'c': json.dumps({"type": chart_type, "data": data})}))
+
     # Method to generate a chart of a given type and data
-    def generate_chart(self, chart_type: str, data: dict):
+    async def generate_chart(self, chart_type: str, data: dict):
         file_name = ""
         try:
             # Create the chart configuration as a JSON object
@@ -35,12 +42,12 @@ class QuickChartIO:
                 "data": data
             }
             # Send a GET request to the base URL with the chart configuration as a parameter
-            response = requests.get(f'{self.base_url}?c={json.dumps(chart_config)}')
+            response = await http_client.get(self.base_url, params={'c': json.dumps(chart_config)})
             if response.status_code == 200:
                 
                 # Save the chart as a PNG file with a random name in the database using the save_graph method
                 file_name = f"graph_{chart_type}_{random.randint(1, 100000)}.png"
-                file_id = self.save_graph(file_name, response.content)
+                file_id = await deadline.call(self.save_graph, file_name, response.content)
                     
                 # Write a success log message to the log file
                 self.write_log(f"Chart saved as {file_name} with id {file_id}")
@@ -48,6 +55,8 @@ class QuickChartIO:
                 # Write an error log message to the log file with the status code
                 self.write_log(f"Error generating chart: {response.status_code}")
             return file_name
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             # Write an exception log message to the log file with the exception details
             self.write_log(f"Error generating chart: {e}")
@@ -70,11 +79,12 @@ class QuickChartIO:
         self.write_log(f"save_graph: executed script")
 
         # Get the gridfs bucket object from the database object with the bucket name 'graphs'
-        bucket = gridfs.GridFSBucket(self.database.db, bucket_name='graphs')
+        bucket = gridfs.GridFSBucket(self.database.db, bucket_name='graphs', chunk_size_bytes=config.Config().image_chunk_size)
         self.write_log(f"save_graph: got gridfs bucket object")
 
         # Store the content in mongodb using the bucket object
         file_id = bucket.upload_from_stream(filename, content)
+        self.database.register_file(filename, "graphs", file_id)
         self.write_log(f"save_graph: stored image file in mongodb")
         # Return the file id
         return output
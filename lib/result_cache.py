@@ -0,0 +1,114 @@
+"""
+Description: Cache of /run_code results keyed by (language, code, stdin, compileOnly)
+and the options that change the response, like the figure format of the graphs.
+Results live in an in-process LRU with a TTL and optionally in a shared MongoDB
+collection, so identical runs are served without executing the code again or
+spending JDoodle credits. Entries are stored as JSON so callers always get a copy.
+"""
+
+import time
+import json
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+
+class ResultCache:
+    # Constructor, collection is an optional pymongo collection used as the shared tier.
+    def __init__(self, ttl=300, max_entries=1024, collection=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.collection = collection
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._indexed = False
+
+    # Method to write logs to a file.
+    def write_log(self, log_msg: str):
+        try:
+            print(str(datetime.now()) + " " + log_msg)
+        except Exception as e:
+            print(str(e))
+
+    # Method to build the cache key of a run, options is a JSON serializable dict of the other response options.
+    @staticmethod
+    def key(language_code, code, stdin=None, compile_only=False, options=None):
+        code_hash = hashlib.sha256((code or "").encode("utf-8", "surrogatepass")).hexdigest()
+        return hashlib.sha256(json.dumps([language_code, code_hash, stdin, bool(compile_only), options or {}],
+                                         sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _create_ttl_index(self):
+        try:
+            # MongoDB removes the expired entries by itself.
+            self.collection.create_index("expiresAt", expireAfterSeconds=0)
+            self._indexed = True
+        except Exception as e:
+            self.write_log(f"ResultCache: failed to create TTL index: {e}")
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set_local(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _get_shared(self, key):
+        try:
+            document = self.collection.find_one({"_id": key, "expiresAt": {"$gt": datetime.utcnow()}})
+            if document:
+                ttl = (document["expiresAt"] - datetime.utcnow()).total_seconds()
+                return document["response"], ttl
+        except Exception as e:
+            self.write_log(f"ResultCache: failed to read shared cache: {e}")
+        return None, 0
+
+    def _set_shared(self, key, value):
+        if not self._indexed:
+            self._create_ttl_index()
+        try:
+            expires_at = datetime.utcnow() + timedelta(seconds=self.ttl)
+            self.collection.replace_one({"_id": key}, {"_id": key, "response": value, "expiresAt": expires_at}, upsert=True)
+        except Exception as e:
+            self.write_log(f"ResultCache: failed to write shared cache: {e}")
+
+    # Method to get a cached response, returns None on a miss.
+    async def get(self, key):
+        value = self._get_local(key)
+        if value is None and self.collection is not None:
+            value, ttl = await asyncio.to_thread(self._get_shared, key)
+            if value is not None:
+                self._set_local(key, value, ttl)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(value)
+
+    # Method to store a response in every tier.
+    async def set(self, key, response):
+        value = json.dumps(response)
+        self._set_local(key, value, self.ttl)
+        if self.collection is not None:
+            await asyncio.to_thread(self._set_shared, key, value)
+
+    # Method to get the cache counters.
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "shared": self.collection is not None}
@@ -0,0 +1,190 @@
+"""
+Description: Single AST pass over a Python script sent to /run_code.
+It reports the imported modules, the show() calls and a few other features used
+to route the script, and rewrites the script once with the show() calls replaced
+by `pass` (line numbers are kept). Results are cached by the hash of the source.
+"""
+
+import io
+import ast
+import threading
+from collections import OrderedDict
+
+from lib.code_cache import source_hash
+
+# Modules that reach external resources, only allowed for whitelisted URLs.
+RESTRICTED_MODULES = {"requests", "pandas", "urllib"}
+# Whitelisted resource that lifts the restriction above.
+WHITELISTED_RESOURCES = ["code-runner-plugin"]
+# Modules that draw graphs.
+GRAPHIC_MODULES = {"matplotlib", "seaborn", "plotly"}
+# Modules whose results change between runs, such scripts are not result-cached.
+NONDETERMINISTIC_MODULES = {"random", "time", "datetime", "uuid", "secrets"}
+# Names of other modules whose results change between runs, also matching their attributes (numpy.random.rand).
+NONDETERMINISTIC_NAMES = {"numpy.random", "os.urandom", "os.getrandom", "os.getpid"}
+
+
+class ScriptAnalysis:
+    def __init__(self, source):
+        self.source = source
+        # Script to execute, with the show() calls removed.
+        self.script = source
+        self.imports = set()
+        # Dotted names used by the script with the import aliases resolved, np.random.rand is numpy.random.rand.
+        self.references = set()
+        self.show_calls = 0
+        self.uses_input = False
+        self.syntax_error = None
+
+    # Top level packages of the imported modules.
+    @property
+    def packages(self):
+        return {module.split(".")[0] for module in self.imports}
+
+    @property
+    def restricted(self):
+        return bool(self.packages & RESTRICTED_MODULES)
+
+    @property
+    def blocked(self):
+        return self.restricted and not any(resource in self.source for resource in WHITELISTED_RESOURCES)
+
+    @property
+    def uses_graphics(self):
+        return bool(self.packages & GRAPHIC_MODULES)
+
+    @property
+    def contains_graph(self):
+        return self.uses_graphics and self.show_calls > 0
+
+    @property
+    def nondeterministic(self):
+        if self.uses_input or self.packages & NONDETERMINISTIC_MODULES:
+            return True
+        return any(name == prefix or name.startswith(prefix + ".")
+                   for name in self.imports | self.references for prefix in NONDETERMINISTIC_NAMES)
+
+
+class _ScriptVisitor(ast.NodeVisitor):
+    def __init__(self, analysis):
+        self.analysis = analysis
+        # show() statements to blank out, as (lineno, col_offset, end_lineno, end_col_offset).
+        self.show_statements = []
+        # Local name -> imported module or object, `import numpy as np` maps np to numpy.
+        self.aliases = {}
+        # Dotted attribute chains rooted at a name, resolved once every import is known.
+        self.attributes = set()
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self.analysis.imports.add(alias.name)
+            if alias.asname:
+                self.aliases[alias.asname] = alias.name
+            else:
+                # `import os.path` binds os.
+                root = alias.name.split(".")[0]
+                self.aliases[root] = root
+        self.generic_visit(node)
+
+    def visit_ImportFrom(self, node):
+        if node.module and node.level == 0:
+            self.analysis.imports.add(node.module)
+            for alias in node.names:
+                self.analysis.imports.add(f"{node.module}.{alias.name}")
+                self.aliases[alias.asname or alias.name] = f"{node.module}.{alias.name}"
+        self.generic_visit(node)
+
+    def visit_Attribute(self, node):
+        parts = [node.attr]
+        value = node.value
+        while isinstance(value, ast.Attribute):
+            parts.append(value.attr)
+            value = value.value
+        if isinstance(value, ast.Name):
+            parts.append(value.id)
+            self.attributes.add(tuple(reversed(parts)))
+        self.generic_visit(node)
+
+    # Method to resolve the attribute chains of imported names, np.random.rand -> numpy.random.rand.
+    def references(self):
+        return {".".join([self.aliases[root], *rest]) for root, *rest in self.attributes if root in self.aliases}
+
+    def visit_Expr(self, node):
+        if _is_show_call(node.value):
+            self.show_statements.append((node.lineno, node.col_offset, node.end_lineno, node.end_col_offset))
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        name = _call_name(node)
+        if name == "show":
+            self.analysis.show_calls += 1
+        elif name == "input":
+            self.analysis.uses_input = True
+        elif name in ("__import__", "import_module") and node.args:
+            # __import__("requests") and importlib.import_module("requests").
+            argument = node.args[0]
+            if isinstance(argument, ast.Constant) and isinstance(argument.value, str):
+                self.analysis.imports.add(argument.value)
+        self.generic_visit(node)
+
+
+def _call_name(node):
+    if isinstance(node.func, ast.Name):
+        return node.func.id
+    if isinstance(node.func, ast.Attribute):
+        return node.func.attr
+    return None
+
+
+def _is_show_call(node):
+    return isinstance(node, ast.Call) and _call_name(node) == "show"
+
+
+# Method to replace statements with `pass` without moving any other line.
+def _blank_statements(source, statements):
+    # Only \n, \r\n and \r end a line for the tokenizer, str.splitlines() would also split on \x0c, \u2028...
+    lines = io.StringIO(source, newline="").readlines()
+    # Work backwards so earlier offsets stay valid, offsets are in UTF-8 bytes.
+    for lineno, col, end_lineno, end_col in sorted(statements, reverse=True):
+        first = lines[lineno - 1].encode("utf-8")
+        last = lines[end_lineno - 1].encode("utf-8")
+        replaced = (first[:col] + b"pass" + last[end_col:]).decode("utf-8")
+        lines[lineno - 1:end_lineno] = [replaced] + ["\n"] * (end_lineno - lineno)
+    return "".join(lines)
+
+
+class ScriptAnalyzer:
+    # Constructor to set the number of cached analyses.
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Method to analyze a script, cached by source hash.
+    def analyze(self, source: str) -> ScriptAnalysis:
+        key = source_hash(source)
+        with self._lock:
+            analysis = self._entries.get(key)
+            if analysis is not None:
+                self._entries.move_to_end(key)
+                return analysis
+
+        analysis = ScriptAnalysis(source)
+        try:
+            tree = ast.parse(source)
+        except (SyntaxError, ValueError) as e:
+            # Left to the compiler to report when the script runs.
+            analysis.syntax_error = str(e)
+            return analysis
+
+        visitor = _ScriptVisitor(analysis)
+        visitor.visit(tree)
+        analysis.references = visitor.references()
+        if visitor.show_statements and analysis.uses_graphics:
+            analysis.script = _blank_statements(source, visitor.show_statements)
+
+        with self._lock:
+            self._entries[key] = analysis
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return analysis
@@ -0,0 +1,59 @@
+"""
+Description: Coalescing of identical executions running at the same time.
+The first caller of a key starts the execution and later callers with the same key
+wait for it instead of starting their own, then every caller gets its own copy of
+the result (or the same exception). The execution is cancelled when every caller
+waiting for it has been cancelled (clients that disconnected), so nobody pays for a
+run that no one will read. Nothing is kept once the execution finishes.
+"""
+
+import copy
+import asyncio
+
+
+class SingleFlight:
+    # Constructor.
+    def __init__(self):
+        self.executions = 0
+        self.coalesced = 0
+        self.abandoned = 0
+        # key -> [task, number of callers waiting for it]
+        self._flights = {}
+
+    # Method to run coroutine_function() once for all the concurrent callers of a key.
+    async def do(self, key, coroutine_function):
+        flight = self._flights.get(key)
+        if flight is None:
+            self.executions += 1
+            # The execution runs as its own task so a caller disconnecting does not cancel it for the others.
+            flight = [asyncio.ensure_future(coroutine_function()), 0]
+            self._flights[key] = flight
+            flight[0].add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            self.coalesced += 1
+        task = flight[0]
+        flight[1] += 1
+        try:
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done():
+                flight[1] -= 1
+                if flight[1] == 0:
+                    # The last caller left, stop the execution instead of letting it run for no one.
+                    self.abandoned += 1
+                    self._forget(key, flight)
+                    task.cancel()
+            raise
+        flight[1] -= 1
+        # Callers add their own fields to the response.
+        return copy.deepcopy(result)
+
+    def _forget(self, key, flight):
+        # A new execution of the key may have started after this one was abandoned.
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    # Method to get the coalescing counters.
+    def stats(self):
+        return {"executions": self.executions, "coalesced": self.coalesced, "abandoned": self.abandoned,
+                "in_flight": len(self._flights)}
@@ -0,0 +1,190 @@
+"""
+Description: Local pre-flight syntax check of the code sent to run_code.
+Broken code is rejected with the line, column and message of the first error
+before it is sent to JDoodle, so it costs milliseconds instead of a round trip and
+a credit. Python is parsed in process, other languages use their installed tools
+(gcc -fsyntax-only, node --check, gofmt -e, bash -n). When the tool is missing a
+bracket matcher looks for unbalanced brackets, but it does not know every literal
+form (text blocks, raw strings, digit separators...), so what it finds is only a
+warning and never blocks the code. Results are cached by language and source hash.
+"""
+
+import os
+import re
+import ast
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+from lib.code_cache import source_hash
+from lib.local_backends import run_process
+
+# Seconds a syntax checking tool may run, the code is accepted when it takes longer.
+CHECK_TIMEOUT = 5
+
+# Tool commands by JDoodle language code, the source is passed as stdin or as {source}.
+CHECK_COMMANDS = {
+    "c": ["gcc", "-fsyntax-only", "-x", "c", "-"],
+    "cpp14": ["g++", "-fsyntax-only", "-x", "c++", "-std=c++14", "-"],
+    "cpp17": ["g++", "-fsyntax-only", "-x", "c++", "-std=c++17", "-"],
+    "go": ["gofmt", "-e"],
+    "bash": ["bash", "-n"],
+    "nodejs": ["node", "--check", "{source}"],
+}
+
+# Languages where brackets outside strings and comments must balance.
+BRACKET_LANGUAGES = {"c", "cpp14", "cpp17", "java", "csharp", "go", "objc"}
+
+# "<stdin>:2:10: error: message" (gcc) and "<standard input>:2:12: message" (gofmt).
+LOCATED_ERROR = re.compile(r"^[^:\n]*:(\d+):(\d+): (?:(?:fatal )?error: )?(.+)$", re.MULTILINE)
+BASH_ERROR = re.compile(r"line (\d+): (.+)$", re.MULTILINE)
+
+
+# blocking is False for findings that may be wrong, the code is still run.
+def _diagnostic(message, line=None, column=None, blocking=True):
+    return {"message": message, "line": line, "column": column, "blocking": blocking}
+
+
+def _check_python(source):
+    try:
+        ast.parse(source)
+    except SyntaxError as e:
+        return _diagnostic(f"{e.__class__.__name__}: {e.msg}", e.lineno, e.offset)
+    except ValueError as e:
+        return _diagnostic(str(e))
+    return None
+
+
+def _position(source, index):
+    return source.count("\n", 0, index) + 1, index - source.rfind("\n", 0, index)
+
+
+# Method to find the first unbalanced bracket, skipping strings, characters and comments.
+def _check_brackets(language_code, source):
+    pairs = {")": "(", "]": "[", "}": "{"}
+    stack = []
+    index = 0
+    quotes = "\"'`" if language_code == "go" else "\"'"
+    preprocessor = language_code in ("c", "cpp14", "cpp17", "objc")
+    while index < len(source):
+        char = source[index]
+        if source.startswith("//", index) or (preprocessor and char == "#" and not source[source.rfind("\n", 0, index) + 1:index].strip()):
+            # Line comments and preprocessor lines may hold anything.
+            index = source.find("\n", index)
+            if index == -1:
+                break
+        elif source.startswith("/*", index):
+            end = source.find("*/", index + 2)
+            if end == -1:
+                return _diagnostic("Unterminated comment", *_position(source, index))
+            index = end + 1
+        elif char in quotes:
+            start = index
+            index += 1
+            while index < len(source) and source[index] != char:
+                if source[index] == "\n" and char != "`":
+                    break
+                # Raw strings (Go backquotes) have no escapes.
+                index += 2 if source[index] == "\\" and char != "`" else 1
+            if index >= len(source) or source[index] != char:
+                return _diagnostic("Unterminated string literal", *_position(source, start))
+        elif char in "([{":
+            stack.append((char, index))
+        elif char in pairs:
+            if not stack or stack[-1][0] != pairs[char]:
+                return _diagnostic(f"Unmatched '{char}'", *_position(source, index))
+            stack.pop()
+        index += 1
+    if stack:
+        char, index = stack[-1]
+        return _diagnostic(f"'{char}' is never closed", *_position(source, index))
+    return None
+
+
+def _parse_tool_output(language_code, output):
+    if language_code == "nodejs":
+        lines = output.splitlines()
+        message = next((text for text in lines if text.startswith("SyntaxError")), "SyntaxError")
+        line = re.search(r":(\d+)$", lines[0]) if lines else None
+        column = lines[2].find("^") + 1 if len(lines) > 2 and "^" in lines[2] else None
+        return _diagnostic(message, int(line.group(1)) if line else None, column or None)
+    if language_code == "bash":
+        match = BASH_ERROR.search(output)
+        if match:
+            return _diagnostic(match.group(2), int(match.group(1)))
+    else:
+        match = LOCATED_ERROR.search(output)
+        if match:
+            return _diagnostic(match.group(3), int(match.group(1)), int(match.group(2)))
+    return _diagnostic(output.strip().splitlines()[0] if output.strip() else "Syntax error")
+
+
+class SyntaxChecker:
+    # Constructor to set the number of cached results.
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.rejected = 0
+        self.warned = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def _check_with_tool(self, language_code, source):
+        command = CHECK_COMMANDS.get(language_code)
+        if command is None or not shutil.which(command[0]):
+            return None, False
+        workdir = tempfile.mkdtemp(prefix="check-")
+        try:
+            stdin = source
+            if "{source}" in command:
+                with open(os.path.join(workdir, "main.js"), "w", encoding="utf-8") as file:
+                    file.write(source)
+                command = [part.replace("{source}", "main.js") for part in command]
+                stdin = None
+            result = await run_process(command, workdir, stdin, CHECK_TIMEOUT, {"cpu": CHECK_TIMEOUT, "output": 64 * 1024})
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        if result["timed_out"] or (result["exit_code"] or 0) < 0:
+            # The tool did not finish, leave the code to the compiler.
+            return None, True
+        if result["exit_code"] == 0:
+            return None, True
+        return _parse_tool_output(language_code, result["output"]), True
+
+    def _count(self, diagnostic):
+        if diagnostic and diagnostic["blocking"]:
+            self.rejected += 1
+        elif diagnostic:
+            self.warned += 1
+
+    # Method to check the code, returns None or a diagnostic {message, line, column, blocking}.
+    # The code may still run when the diagnostic is not blocking.
+    async def check(self, language_code, source):
+        key = (language_code, source_hash(source))
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                diagnostic = self._entries[key]
+                self._count(diagnostic)
+                return diagnostic
+
+        if language_code == "python3":
+            diagnostic = _check_python(source)
+        else:
+            diagnostic, checked = await self._check_with_tool(language_code, source)
+            if not checked and language_code in BRACKET_LANGUAGES:
+                diagnostic = _check_brackets(language_code, source)
+                if diagnostic:
+                    diagnostic["blocking"] = False
+
+        with self._lock:
+            self._entries[key] = diagnostic
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._count(diagnostic)
+        return diagnostic
+
+    # Method to get the checker counters.
+    def stats(self):
+        with self._lock:
+            return {"rejected": self.rejected, "warned": self.warned, "entries": len(self._entries)}
@@ -0,0 +1,125 @@
+"""
+Description: Retry and hedging policy for calls to an upstream service.
+Failed attempts that are safe to repeat are retried a bounded number of times with
+full-jitter exponential backoff, as long as the deadline allows it. When hedging
+is on and an attempt is slower than the recent p95 latency, a second attempt is
+started (the caller puts it on another credential), the first one to succeed wins
+and the other one is cancelled.
+"""
+
+import random
+import asyncio
+import itertools
+import threading
+from collections import deque
+
+
+class RetryableError(Exception):
+    # response is the upstream response to return if no retry is left.
+    def __init__(self, message, response=None):
+        super().__init__(message)
+        self.response = response
+
+
+class UpstreamPolicy:
+    # Constructor, retry_on are the exceptions of an attempt that can be retried.
+    def __init__(self, retries=2, backoff=0.2, max_backoff=2.0, hedge=False, hedge_quantile=0.95,
+                 hedge_min_samples=20, window=200, retry_on=(RetryableError,)):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.retry_on = tuple(retry_on)
+        self.calls = 0
+        self.retried = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    # Method to record the latency of a successful attempt.
+    def record_latency(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+
+    # Method to get the delay after which a hedge starts, None when hedging is off or not warmed up.
+    def hedge_delay(self):
+        if not self.hedge:
+            return None
+        with self._lock:
+            if len(self._latencies) < self.hedge_min_samples:
+                return None
+            latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * self.hedge_quantile))]
+
+    # Full jitter: a random wait up to the exponential backoff of the retry.
+    def backoff_delay(self, retry):
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** retry))
+
+    async def _hedged(self, attempt, numbers):
+        first = asyncio.ensure_future(attempt(next(numbers), False))
+        delay = self.hedge_delay()
+        if delay is None:
+            return await first
+        try:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+        except asyncio.CancelledError:
+            first.cancel()
+            raise
+        if done:
+            return first.result()
+
+        with self._lock:
+            self.hedged += 1
+        second = asyncio.ensure_future(attempt(next(numbers), True))
+        pending = {first, second}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            with self._lock:
+                                self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # The loser is cancelled.
+            for task in pending:
+                task.cancel()
+
+    # Method to run attempt(number, hedge) under the policy, deadline is an event loop time.
+    # The last error is raised when every attempt failed.
+    async def call(self, attempt, deadline):
+        loop = asyncio.get_running_loop()
+        numbers = itertools.count(1)
+        retry = 0
+        with self._lock:
+            self.calls += 1
+        while True:
+            try:
+                return await self._hedged(attempt, numbers)
+            except self.retry_on:
+                wait = self.backoff_delay(retry)
+                retry += 1
+                if retry > self.retries or loop.time() + wait >= deadline:
+                    raise
+                with self._lock:
+                    self.retried += 1
+                await asyncio.sleep(wait)
+
+    # Method to get the policy counters.
+    def stats(self):
+        delay = self.hedge_delay()
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "retries": self.retried,
+                "hedges": self.hedged,
+                "hedge_wins": self.hedge_wins,
+                "hedge_delay": round(delay, 4) if delay is not None else None,
+            }
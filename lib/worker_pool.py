@@ -0,0 +1,538 @@
+"""
+Description: Pool of pre-forked Python worker processes for running scripts locally.
+Each worker imports numpy, pandas and matplotlib (Agg backend) once when it starts,
+then waits for scripts from run_code over a pipe and sends back stdout/stderr.
+This keeps the event loop free of exec() and spreads the work over all CPU cores.
+Output is sent back in chunks while the script runs, so it can be streamed to the client.
+Scripts are compiled once in the parent (see CodeCache) and sent as marshal bytes.
+Every script runs in a child forked from the warm worker with rlimits on CPU time,
+address space, open files and file size. The worker reaps it with wait4() and reports
+the CPU time, the peak RSS on top of the preloaded libraries and the wall time.
+The child writes to a pipe of its own that the worker relays to the parent, so killing
+it never leaves half a message on the worker pipe. A script that overruns its deadline
+is killed, the warm worker itself stays.
+"""
+
+import io
+import os
+import sys
+import time
+import queue
+import signal
+import marshal
+import asyncio
+import functools
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from lib.python_runner import run_script
+from lib.code_cache import CodeCache
+
+# Number of compiled scripts each worker keeps, the parent mirrors this LRU per worker.
+WORKER_CODE_CACHE_SIZE = 64
+
+# Seconds the worker gets to report a killed script before it is replaced.
+KILL_GRACE_PERIOD = 2
+
+# Output messages of a streamed run waiting for the client, the script is held back beyond that.
+STREAM_QUEUE_SIZE = 256
+
+# Seconds between the checks of an idle or relaying worker that the server is still alive.
+PARENT_CHECK_INTERVAL = 1
+
+# Scripts run in a forked child where the platform allows it.
+CAN_FORK = hasattr(os, "fork") and resource is not None
+
+
+# Method to write logs to a file.
+def write_log(log_msg: str):
+    try:
+        print(str(datetime.now()) + " " + log_msg)
+    except Exception as e:
+        print(str(e))
+
+
+# Method to import the heavy libraries once per worker.
+def _warm_up(modules):
+    # One worker runs per core, so the numeric libraries should not start thread pools.
+    for variable in ("OPENBLAS_NUM_THREADS", "OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ.setdefault(variable, "1")
+    for module in modules:
+        try:
+            if module == "matplotlib":
+                # The Agg backend has to be selected before pyplot is imported.
+                import matplotlib
+                matplotlib.use("Agg")
+                import matplotlib.pyplot
+            else:
+                __import__(module)
+        except Exception as e:
+            write_log(f"worker_pool: failed to preload {module}: {e}")
+
+
+# Raised when a script prints more than the output limit, not catchable by `except Exception`.
+class OutputLimitExceeded(BaseException):
+    pass
+
+
+# Text stream that forwards what the script prints to the parent process.
+class _PipeWriter(io.TextIOBase):
+    # Non streaming runs send the output in large chunks to keep the number of messages low.
+    chunk_size = 64 * 1024
+
+    def __init__(self, conn, kind, line_buffered, limit=None):
+        self.conn = conn
+        self.kind = kind
+        self.line_buffered = line_buffered
+        self.limit = limit
+        self.total = 0
+        self._buffer = []
+        self._size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        self.total += len(text)
+        if self.limit is not None and self.total > self.limit:
+            self.flush()
+            raise OutputLimitExceeded(f"Output size limit of {self.limit} characters exceeded")
+        self._buffer.append(text)
+        self._size += len(text)
+        if (self.line_buffered and "\n" in text) or self._size >= self.chunk_size:
+            self.flush()
+        return len(text)
+
+    def flush(self):
+        if self._buffer:
+            self.conn.send((self.kind, "".join(self._buffer)))
+            self._buffer = []
+            self._size = 0
+
+
+# Method to get the virtual memory size of the current process in bytes.
+def _address_space_size():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+# Method to get the resident set size of the current process in kilobytes.
+def _resident_size_kb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError):
+        return 0
+
+
+# Method to set the rlimits of the forked child, hard limits so the script cannot raise them.
+def _apply_limits(limits):
+    if limits.get("cpu"):
+        # The CPU counter of the child starts at zero.
+        resource.setrlimit(resource.RLIMIT_CPU, (limits["cpu"], limits["cpu"] + 1))
+    if limits.get("memory"):
+        # The preloaded libraries already map a lot of address space, the limit comes on top of it.
+        memory = _address_space_size() + limits["memory"]
+        resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    if limits.get("files"):
+        resource.setrlimit(resource.RLIMIT_NOFILE, (limits["files"], limits["files"]))
+    if limits.get("file_size"):
+        resource.setrlimit(resource.RLIMIT_FSIZE, (limits["file_size"], limits["file_size"]))
+
+
+# Method to run the job in the current process, sending the output and the result over conn.
+def _run_job(conn, code, job):
+    line_buffered = job.get("stream", False)
+    limit = job.get("limits", {}).get("output")
+    try:
+        result = run_script(code, capture_graph=job.get("capture_graph"), stdin=job.get("stdin"),
+                            stdout=_PipeWriter(conn, "stdout", line_buffered, limit),
+                            stderr=_PipeWriter(conn, "stderr", line_buffered, limit))
+    except OutputLimitExceeded as e:
+        result = {"output": "", "stderr": "", "error": str(e), "graphs": []}
+    except MemoryError:
+        result = {"output": "", "stderr": "", "error": "Memory limit exceeded", "graphs": []}
+    conn.send(("result", result))
+
+
+# Method to describe how the child ended when it did not report a result itself.
+def _exit_error(status):
+    if os.WIFSIGNALED(status):
+        number = os.WTERMSIG(status)
+        if number == signal.SIGXCPU:
+            return "CPU time limit exceeded"
+        if number == signal.SIGXFSZ:
+            return "File size limit exceeded"
+        return f"Script was killed by signal {signal.Signals(number).name}"
+    return f"Script exited with status {os.WEXITSTATUS(status)}"
+
+
+# Method to fork a child for the job, apply the limits and account the resources it used.
+def _fork_job(conn, code, job, parent_pid=None):
+    started = time.monotonic()
+    # The child starts with the pages of the warm worker (the preloaded libraries) resident,
+    # its peak RSS is reported without them.
+    baseline = _resident_size_kb()
+    # The child writes to a pipe of its own and the worker relays whole messages to the parent,
+    # so a child killed in the middle of a message cannot leave a partial frame on conn.
+    reader, writer = multiprocessing.Pipe(duplex=False)
+    pid = os.fork()
+    if pid == 0:
+        status = 0
+        try:
+            # The script must not be able to write to the worker pipe.
+            conn.close()
+            reader.close()
+            # Own process group so the whole group can be killed on timeout.
+            os.setpgid(0, 0)
+            _apply_limits(job.get("limits", {}))
+            _run_job(writer, code, job)
+        except BaseException:
+            status = 1
+        finally:
+            os._exit(status)
+
+    writer.close()
+    try:
+        conn.send(("started", pid))
+        while True:
+            try:
+                if not reader.poll(PARENT_CHECK_INTERVAL):
+                    if not _parent_alive(parent_pid):
+                        raise EOFError("server process exited")
+                    continue
+                message = reader.recv()
+            except (EOFError, OSError):
+                if not _parent_alive(parent_pid):
+                    raise
+                # The child exited or was killed, maybe halfway through a message.
+                break
+            conn.send(message)
+            if message[0] == "result":
+                break
+    except BaseException:
+        # The parent is gone, the script must not outlive the worker.
+        _kill_child(pid)
+        os.waitpid(pid, 0)
+        raise
+    finally:
+        reader.close()
+    _, status, usage = os.wait4(pid, 0)
+    conn.send(("usage", {
+        "cpu_time": round(usage.ru_utime + usage.ru_stime, 4),
+        # ru_maxrss is in kilobytes on Linux.
+        "peak_rss_kb": max(0, usage.ru_maxrss - baseline),
+        "preload_rss_kb": baseline,
+        "wall_time": round(time.monotonic() - started, 4),
+        "exit_error": None if status == 0 else _exit_error(status),
+    }))
+
+
+# Method to check that the server process that started the worker is still its parent.
+def _parent_alive(parent_pid):
+    return parent_pid is None or os.getppid() == parent_pid
+
+
+# Main loop of a worker process.
+# Messages sent back are ("started", pid), ("stdout", text), ("stderr", text), ("result", dict)
+# and finally ("usage", dict).
+# inherited are the parent ends of the worker pipes copied by fork, closed so the worker sees EOF
+# when the server exits. parent_pid is checked too, for a server killed without closing its pipes.
+def _worker_main(conn, preload, inherited=(), parent_pid=None):
+    for connection in inherited:
+        try:
+            connection.close()
+        except OSError:
+            pass
+    _warm_up(preload)
+    code_objects = OrderedDict()
+    while True:
+        try:
+            if not conn.poll(PARENT_CHECK_INTERVAL):
+                if not _parent_alive(parent_pid):
+                    break
+                continue
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        # None is the shutdown signal.
+        if job is None:
+            break
+        # The bytecode is only sent when this worker does not have the script cached yet.
+        key = job["key"]
+        if "bytecode" in job:
+            code_objects[key] = marshal.loads(job["bytecode"])
+            if len(code_objects) > WORKER_CODE_CACHE_SIZE:
+                code_objects.popitem(last=False)
+        else:
+            code_objects.move_to_end(key)
+        try:
+            if CAN_FORK:
+                _fork_job(conn, code_objects[key], job, parent_pid)
+            else:
+                started = time.monotonic()
+                _run_job(conn, code_objects[key], job)
+                conn.send(("usage", {"cpu_time": None, "peak_rss_kb": None, "wall_time": round(time.monotonic() - started, 4), "exit_error": None}))
+        except (EOFError, OSError):
+            break
+    conn.close()
+
+
+# Method to kill a script child and everything it started.
+def _kill_child(pid):
+    for kill in (os.killpg, os.kill):
+        try:
+            kill(pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+class _Worker:
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        # Keys of the scripts cached in the worker process, in LRU order.
+        self.cached = OrderedDict()
+
+    # Method to build the job message, leaving out the bytecode if the worker has it.
+    def job(self, key, bytecode, code_cache):
+        if key in self.cached:
+            self.cached.move_to_end(key)
+            code_cache.record_worker_hit()
+            return {"key": key}
+        self.cached[key] = True
+        if len(self.cached) > WORKER_CODE_CACHE_SIZE:
+            self.cached.popitem(last=False)
+        return {"key": key, "bytecode": bytecode}
+
+    def kill(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=1)
+
+
+class PythonWorkerPool:
+    # Constructor to set the pool size and the modules every worker preloads.
+    # limits holds the per-run cpu seconds, memory bytes, open files, file size bytes and output characters.
+    def __init__(self, size=None, preload=(), code_cache=None, limits=None):
+        self.size = size or os.cpu_count() or 1
+        self.preload = tuple(preload)
+        self.code_cache = code_cache or CodeCache()
+        self.limits = dict(limits or {})
+        # Fork is the cheapest way to start workers where it is available.
+        if sys.platform.startswith("linux"):
+            self._context = multiprocessing.get_context("fork")
+        else:
+            self._context = multiprocessing.get_context()
+        self._idle = queue.Queue()
+        self._workers = set()
+        self._lock = threading.Lock()
+        # Forks one worker at a time, so every new worker knows all the pipe ends it inherits.
+        self._spawn_lock = threading.Lock()
+        self._started = False
+        # Threads that wait on the worker pipes so the event loop never blocks.
+        self._executor = ThreadPoolExecutor(max_workers=self.size * 4, thread_name_prefix="python-pool")
+
+    # Method to start the worker processes, safe to call more than once.
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            for _ in range(self.size):
+                self._idle.put(self._spawn())
+            self._started = True
+            write_log(f"worker_pool: started {self.size} python workers")
+
+    def _spawn(self):
+        with self._spawn_lock:
+            parent_conn, child_conn = self._context.Pipe()
+            # The fork copies the parent end of this pipe and of the pipes of the other workers.
+            inherited = [parent_conn] + [worker.conn for worker in self._workers]
+            process = self._context.Process(target=_worker_main, args=(child_conn, self.preload, inherited, os.getpid()),
+                                            daemon=True)
+            process.start()
+            child_conn.close()
+            worker = _Worker(process, parent_conn)
+            self._workers.add(worker)
+            return worker
+
+    def _replace(self, worker):
+        with self._spawn_lock:
+            self._workers.discard(worker)
+            worker.kill()
+        return self._spawn()
+
+    def _acquire(self, deadline, cancel_event):
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            wait = 0.1 if deadline is None else min(0.1, deadline - time.monotonic())
+            if wait <= 0:
+                return None
+            try:
+                return self._idle.get(timeout=wait)
+            except queue.Empty:
+                continue
+
+    # Method to run a script on the next idle worker and return its result.
+    # deadline is a time.monotonic() value, cancel_event a threading.Event set by the caller.
+    # on_output(kind, text) receives the output as it is produced instead of collecting it,
+    # in large chunks unless stream is set, which sends every line as soon as it is printed.
+    # stdin is the text the script reads from standard input.
+    def execute(self, code, capture_graph=None, deadline=None, cancel_event=None, on_output=None, stdin=None, stream=False):
+        self.start()
+        result = {"output": "", "stderr": "", "error": None, "graphs": [], "timed_out": False}
+        try:
+            key, bytecode = self.code_cache.get(code)
+        except (SyntaxError, ValueError) as e:
+            # Invalid scripts never reach a worker.
+            result["error"] = str(e)
+            return result
+        worker = self._acquire(deadline, cancel_event)
+        if worker is None:
+            result["timed_out"] = True
+            result["error"] = "Timed out while waiting for a free python worker"
+            return result
+        output = {"stdout": [], "stderr": []}
+        child_pid = None
+        killed_at = None
+        try:
+            job = worker.job(key, bytecode, self.code_cache)
+            job.update({"capture_graph": capture_graph, "stream": stream, "limits": self.limits, "stdin": stdin})
+            worker.conn.send(job)
+            while True:
+                # Checked on every message too, a script printing all the time keeps the pipe readable.
+                if killed_at is None:
+                    cancelled = cancel_event is not None and cancel_event.is_set()
+                    if cancelled or (deadline is not None and time.monotonic() >= deadline):
+                        result["timed_out"] = True
+                        result["error"] = "Script execution cancelled" if cancelled else "Script execution timed out"
+                        killed_at = time.monotonic()
+                        if child_pid is None:
+                            # Without a child process the whole worker has to go.
+                            write_log("worker_pool: script overran its deadline, killing the python worker")
+                            worker = self._replace(worker)
+                            break
+                        write_log("worker_pool: script overran its deadline, killing it")
+                        _kill_child(child_pid)
+                elif time.monotonic() - killed_at > KILL_GRACE_PERIOD:
+                    # The worker did not report the killed child, replace it.
+                    worker = self._replace(worker)
+                    break
+                if not worker.conn.poll(0.05):
+                    continue
+                kind, payload = worker.conn.recv()
+                if kind == "started":
+                    child_pid = payload
+                elif kind == "result":
+                    if killed_at is None:
+                        result.update(payload)
+                elif kind == "usage":
+                    exit_error = payload.pop("exit_error")
+                    result["usage"] = payload
+                    # The child died before it could report, e.g. killed by the CPU limit.
+                    if exit_error and not result["error"]:
+                        result["error"] = exit_error
+                    break
+                elif killed_at is not None:
+                    # Output still in the pipe after the kill is dropped.
+                    continue
+                elif on_output:
+                    on_output(kind, payload)
+                else:
+                    output[kind].append(payload)
+            if on_output is None:
+                result["output"] = "".join(output["stdout"])
+                result["stderr"] = "".join(output["stderr"])
+            return result
+        except (EOFError, OSError):
+            # The worker itself died, start a fresh one.
+            write_log("worker_pool: python worker exited unexpectedly, restarting it")
+            worker = self._replace(worker)
+            raise RuntimeError("Python worker exited unexpectedly while running the script")
+        finally:
+            self._idle.put(worker)
+
+    # Async version of execute, cancelling the awaiting task kills the script.
+    # on_output is called from a pool thread, not from the event loop.
+    async def run(self, code, capture_graph=None, timeout=None, on_output=None, stdin=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        cancel_event = threading.Event()
+        loop = asyncio.get_running_loop()
+        call = functools.partial(self.execute, code, capture_graph, deadline, cancel_event, on_output, stdin)
+        try:
+            return await loop.run_in_executor(self._executor, call)
+        except asyncio.CancelledError:
+            cancel_event.set()
+            raise
+
+    # Async generator yielding ("stdout"|"stderr", text) while the script runs and ("exit", result) at the end.
+    # Closing the generator early (client went away) kills the script.
+    # A client reading slowly holds back the script: once STREAM_QUEUE_SIZE messages wait, the pool
+    # thread stops reading the worker pipe until the client catches up or the deadline passes.
+    async def stream(self, code, capture_graph=None, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        cancel_event = threading.Event()
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+
+        def on_output(kind, text):
+            put = asyncio.run_coroutine_threadsafe(events.put((kind, text)), loop)
+            while True:
+                try:
+                    put.result(timeout=0.1)
+                    return
+                except FutureTimeoutError:
+                    # execute kills the script on its next check.
+                    if cancel_event.is_set() or (deadline is not None and time.monotonic() >= deadline):
+                        put.cancel()
+                        return
+
+        call = functools.partial(self.execute, code, capture_graph, deadline, cancel_event, on_output, stream=True)
+        future = loop.run_in_executor(self._executor, call)
+        getter = None
+        try:
+            while True:
+                # on_output returns once its message is queued, so the output is all queued when the future is done.
+                if future.done() and events.empty():
+                    yield "exit", future.result()
+                    return
+                getter = asyncio.ensure_future(events.get())
+                await asyncio.wait({getter, future}, return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    continue
+                yield getter.result()
+        finally:
+            if getter is not None:
+                getter.cancel()
+            cancel_event.set()
+
+    # Method to stop all the worker processes.
+    def shutdown(self):
+        with self._lock:
+            for worker in list(self._workers):
+                try:
+                    worker.conn.send(None)
+                    worker.process.join(timeout=1)
+                except Exception:
+                    pass
+                worker.kill()
+            self._workers.clear()
+            self._idle = queue.Queue()
+            self._started = False
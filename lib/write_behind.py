@@ -0,0 +1,170 @@
+"""
+Description: Write-behind queue coalescing small MongoDB writes into bulk_write batches.
+Code saves and the PluginLab user webhooks each write one document, and webhook
+bursts send many of them at once. Writes are queued per collection and flushed as
+one ordered bulk_write when the batch is full or the interval elapses. Writes with
+the same key collapse to the last one (a user's quota updates keep only the newest
+value). Durability is configurable:
+  off          - no queue, every write is sent on its own
+  acknowledged - the caller waits until the batch with its write is written
+  buffered     - the caller returns at once, a crash loses at most one interval
+The queue is flushed when the app stops.
+"""
+
+import asyncio
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from pymongo.errors import BulkWriteError
+
+DURABILITY_MODES = ("off", "acknowledged", "buffered")
+
+
+class WriteBehindQueue:
+    # Constructor, db is the database of an AsyncMongoDB.
+    def __init__(self, db, batch_size=100, interval=0.05, durability="acknowledged"):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"durability must be one of {DURABILITY_MODES}")
+        self.db = db
+        self.batch_size = batch_size
+        self.interval = interval
+        self.durability = durability
+        self.running = False
+        self.flushes = 0
+        self.written = 0
+        self.collapsed = 0
+        self.errors = 0
+        # collection -> key -> (operation, futures of the callers waiting for it)
+        self._pending = {}
+        self._size = 0
+        self._task = None
+        self._wake = None
+        self._flush_lock = None
+        self._lock = threading.Lock()
+
+    # Method to write logs to a file.
+    def write_log(self, log_msg: str):
+        try:
+            print(str(datetime.now()) + " " + log_msg)
+        except Exception as e:
+            print(str(e))
+
+    # Method to start the flushing task, call it outside any request so it gets no request deadline.
+    def start(self):
+        if self.durability == "off" or self.running:
+            return
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+        self.running = True
+
+    # Method to queue a write (a pymongo InsertOne/UpdateOne...), key collapses writes to the last one.
+    async def submit(self, collection, operation, key=None):
+        if not self.running:
+            await self.db[collection].bulk_write([operation])
+            return
+        future = asyncio.get_running_loop().create_future() if self.durability == "acknowledged" else None
+        with self._lock:
+            entries = self._pending.setdefault(collection, OrderedDict())
+            key = key if key is not None else object()
+            futures = []
+            if key in entries:
+                # The newer write replaces the older one and moves after the writes queued in between.
+                _, futures = entries.pop(key)
+                self.collapsed += 1
+            else:
+                self._size += 1
+            if future is not None:
+                futures.append(future)
+            entries[key] = (operation, futures)
+            full = self._size >= self.batch_size
+        if full:
+            self._wake.set()
+        if future is not None:
+            # The write goes on even if the caller is cancelled.
+            await asyncio.shield(future)
+
+    async def _run(self):
+        while self.running:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    @staticmethod
+    def _settle(futures, error=None):
+        for future in futures:
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+
+    async def _write_batch(self, collection, entries):
+        while entries:
+            try:
+                await self.db[collection].bulk_write([operation for operation, _ in entries], ordered=True)
+            except BulkWriteError as e:
+                # An ordered batch stops at its first failed write, the writes after it are sent again.
+                index = e.details["writeErrors"][0]["index"]
+                with self._lock:
+                    self.written += index
+                    self.errors += 1
+                for _, futures in entries[:index]:
+                    self._settle(futures)
+                self._settle(entries[index][1], e)
+                self.write_log(f"WriteBehindQueue: write {index} of a batch on {collection} failed: {e.details['writeErrors'][0].get('errmsg')}")
+                entries = entries[index + 1:]
+                continue
+            except Exception as e:
+                with self._lock:
+                    self.errors += len(entries)
+                for _, futures in entries:
+                    self._settle(futures, e)
+                self.write_log(f"WriteBehindQueue: failed to write {len(entries)} operation(s) on {collection}: {e}")
+                return
+            with self._lock:
+                self.written += len(entries)
+            for _, futures in entries:
+                self._settle(futures)
+            return
+
+    # Method to write every queued operation, one bulk_write per collection.
+    async def flush(self):
+        if self._flush_lock is None:
+            return
+        async with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._size = 0
+            if not pending:
+                return
+            await asyncio.gather(*[self._write_batch(collection, list(entries.values())) for collection, entries in pending.items()])
+            with self._lock:
+                self.flushes += 1
+
+    # Method to stop the flushing task and write what is still queued, called when the app stops.
+    async def stop(self):
+        if not self.running:
+            return
+        # New writes are sent directly, the task ends after its current flush.
+        self.running = False
+        self._wake.set()
+        await self._task
+        await self.flush()
+
+    # Method to get the queue counters.
+    def stats(self):
+        with self._lock:
+            return {
+                "durability": self.durability,
+                "queued": self._size,
+                "flushes": self.flushes,
+                "written": self.written,
+                "collapsed": self.collapsed,
+                "errors": self.errors,
+            }
@@ -3,18 +3,40 @@ from datetime import datetime, timezone, timedelta
 from urllib.parse import quote
 from quart import Quart, request, jsonify, redirect, Response, url_for
 import traceback
+import asyncio
 import quart
 import os
+import mimetypes
+import difflib
 import gridfs
+import httpx
 from pathlib import Path
 
 from quart_cors import cors
 
 from lib.mongo_db import MongoDB
+from lib.async_mongo_db import AsyncMongoDB
+from lib.mongo_db import LISTED_BUCKETS, decode_cursor
+from lib.write_behind import WriteBehindQueue
 from lib.python_runner import *
 from lib.jdoodle_api import *
 from lib.quick_chart import QuickChartIO
 from lib.kod import Kodso
+from lib.worker_pool import PythonWorkerPool
+from lib.output_capture import OutputCapture
+from lib.code_cache import CodeCache
+from lib.result_cache import ResultCache
+from lib.script_analyzer import ScriptAnalyzer
+from lib.credit_tracker import CreditTracker
+from lib.jdoodle_pool import JDoodleClientPool
+from lib.single_flight import SingleFlight
+from lib.local_backends import get_backend, CompileError
+from lib.artifact_cache import ArtifactCache
+from lib.syntax_check import SyntaxChecker
+from lib.upstream_policy import UpstreamPolicy, RetryableError
+from lib.http_client import http_client
+from lib import deadline
+from lib.deadline import DeadlineExceeded
 from config import Config
 
 config = Config()
@@ -40,6 +62,8 @@ code_runner_snippet_prompt = "https://chat.openai.com/share/1b61bc05-067b-4779-b
 # setting the database.
 global database
 database = None
+# async variant awaited by the request handlers.
+async_database = None
 global quick_chart
 quick_chart = None
 carbonara = None
@@ -48,11 +72,88 @@ kodso = None
 try:
     # setting the database
     database = MongoDB()
+    async_database = AsyncMongoDB()
     quick_chart = QuickChartIO(database)
     kodso = Kodso(database)
 except Exception as e:
     print("Exception while connecting to the database : " + str(e))
 
+# setting the write-behind queue batching the code saves and the user webhook writes.
+write_behind = None
+if async_database is not None:
+    write_behind = WriteBehindQueue(async_database.db, config.write_behind_batch, config.write_behind_interval, config.write_behind)
+    async_database.write_behind = write_behind
+
+# setting the cache of compiled python scripts, shared with the worker pool.
+code_cache = CodeCache(config.code_cache_entries, config.code_cache_bytes)
+
+# setting the analyzer of python scripts, analyses are cached by source hash.
+script_analyzer = ScriptAnalyzer()
+
+# setting the opt-in result cache, with a shared MongoDB tier if configured.
+result_cache = None
+if config.result_cache:
+    shared_collection = database.db["run_cache"] if database is not None and config.result_cache_mongo else None
+    result_cache = ResultCache(config.result_cache_ttl, config.result_cache_entries, shared_collection)
+
+# setting the JDoodle credit counter, persisted in MongoDB so all instances share it.
+jdoodle_credentials = dict(get_jdoodle_credentials())
+credit_tracker = CreditTracker(lambda client_id: get_credits_used(client_id, jdoodle_credentials[client_id]),
+                               database.db["jdoodle_credits"] if database is not None else None,
+                               config.credit_sync_interval)
+
+# setting the JDoodle client pool, each request goes to the least loaded healthy client.
+jdoodle_pool = JDoodleClientPool(jdoodle_credentials.items(), credit_tracker, config.jdoodle_daily_limit,
+                                 config.jdoodle_failure_threshold, config.jdoodle_reset_timeout)
+
+credit_sync_task = None
+index_task = None
+
+# Pre-flight syntax check, broken code is rejected before it reaches JDoodle.
+syntax_checker = SyntaxChecker()
+
+# Retry and hedging policy of the JDoodle execute calls.
+# Connection failures and these statuses are retried, 429 moves on to another client.
+JDOODLE_RETRY_STATUS = {429, 500, 502, 503, 504}
+jdoodle_policy = UpstreamPolicy(config.jdoodle_retries, config.jdoodle_retry_backoff, hedge=config.jdoodle_hedge,
+                                hedge_quantile=config.jdoodle_hedge_quantile,
+                                retry_on=(RetryableError, httpx.ConnectError, httpx.RemoteProtocolError))
+
+
+class NoJDoodleClientError(Exception):
+    pass
+
+
+# Identical runs in flight at the same time share one execution.
+single_flight = SingleFlight()
+
+# Limit of JDoodle calls running at the same time for batches.
+jdoodle_semaphore = asyncio.Semaphore(config.batch_concurrency)
+
+# Limits of every local run, Python scripts and programs of the local backends.
+run_limits = {
+    "cpu": config.run_cpu_limit,
+    "memory": config.run_memory_limit,
+    "files": config.run_file_limit,
+    "file_size": config.run_file_size_limit,
+    "output": config.run_output_limit,
+}
+
+# Limit of programs running on the local backends at the same time.
+local_semaphore = asyncio.Semaphore(config.local_concurrency)
+
+# setting the cache of compiled programs, unchanged code is not compiled again.
+artifact_cache = None
+if config.artifact_cache_dir:
+    try:
+        artifact_cache = ArtifactCache(config.artifact_cache_dir, config.artifact_cache_bytes)
+    except OSError as e:
+        write_log(f"Artifact cache disabled: {e}")
+
+# setting the python worker pool, the workers are forked on first use or at startup.
+# Scripts always run in a worker: in-process runs would share sys.stdout and could not be killed.
+python_pool = PythonWorkerPool(max(1, config.python_workers), config.python_preload, code_cache, run_limits)
+
 # defining the origin for CORS
 ORIGINS = [plugin_url,website_url]
 
@@ -113,11 +214,11 @@ def write_log(log_msg: str):
 
 
 # Method to generate TinyURL links.
-def generate_tinyurl(url: str):
+async def generate_tinyurl(url: str):
     tiny_url = ""
     try:
         data = {"url": url, "accesskey": os.getenv("ACCESS_KEY")}
-        tiny_url = requests.post(config.api_url, data=data).json()["short_link"]
+        tiny_url = (await http_client.post(config.api_url, data=data)).json()["short_link"]
         write_log("generating tinyurl : " + tiny_url)
     except Exception as e:
         write_log("Exception while generating tinyurl : " + str(e))
@@ -125,31 +226,257 @@ def generate_tinyurl(url: str):
 
 
 # Define a method to save the plot in mongodb
-def save_graph(filename):
+def save_graph(filename, image_data, content_type="image/png"):
     output = {}
     global database
     write_log(f"save_graph: executed script")
 
-    # Save the plot as an image file in a buffer
-    buffer = io.BytesIO()
-    write_log(f"save_graph: saving graph")
-
-    # Using matplotlib to save the plot as an image file in a buffer
-    import matplotlib.pyplot as plt
-    plt.savefig(buffer, format='png')
-    write_log(f"save_graph: saved graph")
-
     # Get the gridfs bucket object from the database object with the bucket name 'graphs'
-    bucket = gridfs.GridFSBucket(database.db, bucket_name='graphs')
+    bucket = gridfs.GridFSBucket(database.db, bucket_name='graphs', chunk_size_bytes=config.image_chunk_size)
     write_log(f"save_graph: got gridfs bucket object")
 
-    # Store the image file in mongodb using the bucket object
-    file_id = bucket.upload_from_stream(filename, buffer.getvalue())
+    # Store the image rendered by the python worker in mongodb using the bucket object
+    file_id = bucket.upload_from_stream(filename, image_data, metadata={"contentType": content_type})
+    database.register_file(filename, "graphs", file_id)
     write_log(f"save_graph: stored image file in mongodb")
     # Return the file id
     return output
 
 
+# Method to upload all the figures of a script concurrently, returns their download links.
+async def save_graphs(graph_name, graph_options, images):
+    image_format = graph_options["format"]
+    if len(images) == 1:
+        filenames = [f"{graph_name}.{image_format}"]
+    else:
+        filenames = [f"{graph_name}_{index + 1}.{image_format}" for index in range(len(images))]
+    await asyncio.gather(*[asyncio.to_thread(save_graph, filename, image, GRAPH_FORMATS[image_format])
+                           for filename, image in zip(filenames, images)])
+    return [f"{plugin_url}/download/{filename}" for filename in filenames]
+
+
+# Method to get the figure format, DPI and compression from the request data.
+def get_graph_options(data):
+    graph_options = {"format": str(data.get('graphFormat') or "png").lower()}
+    if graph_options["format"] not in GRAPH_FORMATS:
+        graph_options["format"] = "png"
+    try:
+        if data.get('graphDpi'):
+            graph_options["dpi"] = max(50, min(int(data.get('graphDpi')), 300))
+        if data.get('graphCompression') is not None:
+            graph_options["compression"] = max(0, min(int(data.get('graphCompression')), 9))
+        if data.get('graphQuality') is not None:
+            graph_options["quality"] = max(1, min(int(data.get('graphQuality')), 100))
+    except (TypeError, ValueError):
+        pass
+    return graph_options
+
+
+# Method to get the run timeout in seconds from the request data.
+def get_run_timeout(data):
+    try:
+        timeout = float(data.get('timeout') or config.run_timeout)
+    except (TypeError, ValueError):
+        timeout = config.run_timeout
+    return max(1, min(timeout, config.max_run_timeout))
+
+
+# Method to create bounded captures for stdout and stderr, big outputs spill into GridFS.
+def create_output_captures():
+    run_id = generate_code_id()
+    captures, filenames = {}, {}
+    for kind in ("stdout", "stderr"):
+        filename = f"output_{run_id}_{kind}.txt"
+        open_spill = None
+        if database is not None:
+            open_spill = lambda filename=filename: database.open_output_stream(filename)
+        captures[kind] = OutputCapture(config.output_limit, config.output_preview, open_spill)
+        filenames[kind] = filename
+    return captures, filenames
+
+
+# Method to execute the Python script in the worker pool without blocking the event loop.
+async def execute_python(script, capture_graph=None, timeout=None):
+    captures, filenames = create_output_captures()
+    on_output = lambda kind, text: captures[kind].write(text)
+    result = await python_pool.run(script, capture_graph=capture_graph, timeout=timeout, on_output=on_output)
+
+    # Only the head and tail of a large output are returned, the full output gets a download link.
+    for kind, key in (("stdout", "output"), ("stderr", "stderr")):
+        capture = captures[kind]
+        result[key] = capture.getvalue()
+        if capture.spilled:
+            result["truncated"] = True
+        if await asyncio.to_thread(capture.close):
+            result[f"{key}_link"] = f"{plugin_url}/download/{filenames[kind]}"
+
+    # Raise the script error so run_code reports it like before.
+    if result["error"] and not result["timed_out"]:
+        raise RuntimeError(result["error"])
+    return result
+
+
+# Method to build the run_code response from the script result.
+def python_output(result):
+    response = {"output": result["output"]}
+    if result["stderr"]:
+        response["stderr"] = result["stderr"]
+    if result.get("truncated"):
+        response["truncated"] = True
+        for key in ("output_link", "stderr_link"):
+            if key in result:
+                response[key] = result[key]
+    if result["timed_out"]:
+        response["error"] = result["error"]
+    response["timed_out"] = result["timed_out"]
+    if result.get("usage"):
+        response["usage"] = result["usage"]
+    return response
+
+
+# Method to format a server-sent event.
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+# Method to stream the Python script output as server-sent events.
+def stream_python(script, timeout, graph_name="", graph_options=None):
+    async def events():
+        result = None
+        async for kind, payload in python_pool.stream(script, capture_graph=graph_options, timeout=timeout):
+            if kind == "exit":
+                result = payload
+            else:
+                yield sse_event(kind, {"text": payload})
+
+        # The last event carries the exit status of the script.
+        message = {"exit_status": 1 if result["error"] else 0, "timed_out": result["timed_out"], "error": result["error"], "usage": result.get("usage")}
+        if graph_name and result["graphs"]:
+            links = await save_graphs(graph_name, graph_options, result["graphs"])
+            message["output"] = links[0]
+            message["graphs"] = links
+        yield sse_event("exit", message)
+
+    response = Response(events(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    # Stop proxies from buffering the stream.
+    response.headers["X-Accel-Buffering"] = "no"
+    response.timeout = timeout + 30
+    return response
+
+
+# Method to run the code on the JDoodle API off the event loop.
+# Attempts go through the upstream policy: retries with jitter and an optional hedge on another client.
+async def execute_jdoodle(script, language_code, input=None, compile_only=False, timeout=None):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    headers = {
+        'Content-Type': 'application/json',
+        'X-Requested-With': 'XMLHttpRequest',
+        'Origin': 'code-runner-plugin.vercel.app',
+        'Referer': 'https://code-runner-plugin.vercel.app'
+    }
+    # Clients already used by this run, retries and hedges go to the others first.
+    used_clients = set()
+
+    async def attempt(number, hedge):
+        # Pick the least loaded healthy client, using the locally counted credits.
+        credential = await asyncio.to_thread(jdoodle_pool.acquire, used_clients)
+        if credential is None and hedge:
+            raise RetryableError("No other JDoodle client to hedge on")
+        if credential is None and used_clients:
+            credential = await asyncio.to_thread(jdoodle_pool.acquire)
+        if credential is None:
+            raise NoJDoodleClientError("All JDoodle clients are out of credits or unavailable, please try again later.")
+        used_clients.add(credential.client_id)
+
+        body = {
+            'clientId': credential.client_id,
+            'clientSecret': credential.client_secret,
+            'script': script,
+            'language': language_code,
+            'stdin': input,
+            'compileOnly': compile_only,
+            'versionIndex': '0',
+        }
+
+        # The remaining budget is used as the HTTP timeout.
+        started = loop.time()
+        remaining = max(0.1, deadline - started)
+        success = exhausted = False
+        status = "failed"
+        try:
+            response_data = await http_client.post(compiler_url, headers=headers, content=json.dumps(body), timeout=remaining)
+            status = response_data.status_code
+            # 429 means the daily credits of the client are used up, 401 a revoked client.
+            exhausted = status == 429
+            success = status < 500 and status not in (401, 429)
+        except asyncio.CancelledError:
+            # Lost the race against a hedge, JDoodle may still have spent a credit on it.
+            success = None
+            status = "cancelled"
+            raise
+        finally:
+            latency = loop.time() - started
+            jdoodle_pool.release(credential, success, latency if success is not None else None, exhausted)
+            write_log(f"execute_jdoodle: attempt {number}{' (hedge)' if hedge else ''} on {credential.client_id[:8]} took {latency:.3f}s, status {status}")
+
+        if status in JDOODLE_RETRY_STATUS:
+            raise RetryableError(f"JDoodle answered {status}", response_data)
+        await credit_tracker.record(credential.client_id)
+        jdoodle_policy.record_latency(latency)
+        return response_data
+
+    try:
+        response_data = await jdoodle_policy.call(attempt, deadline)
+    except NoJDoodleClientError as e:
+        return {"error": str(e), "timed_out": False}
+    except RetryableError as e:
+        if e.response is None:
+            return {"error": f"JDoodle is unavailable, please try again later. ({e})", "timed_out": False}
+        # No retry left, report what JDoodle answered.
+        response_data = e.response
+    response = json.loads(response_data.content.decode('utf-8'))
+
+    # Append the discord and github URLs to the response.
+    if response_data.status_code == 200:
+        unique_id = generate_code_id(response)
+        # response['support'] = support_message
+        response['id'] = unique_id
+        response['extra_response_instructions'] = extra_response_instructions
+    response['timed_out'] = False
+    return response
+
+
+# Method to describe a pre-flight diagnostic with its position.
+def preflight_message(diagnostic, kind="Syntax error"):
+    location = f" at line {diagnostic['line']}" if diagnostic["line"] else ""
+    if diagnostic["line"] and diagnostic["column"]:
+        location += f", column {diagnostic['column']}"
+    return f"{kind}{location}: {diagnostic['message']}"
+
+
+# Method to build the response of code rejected by the pre-flight syntax check.
+def preflight_error(diagnostic):
+    return {"error": preflight_message(diagnostic), "line": diagnostic["line"],
+            "column": diagnostic["column"], "preflight": True}
+
+
+# Method to describe a non blocking diagnostic, the code runs anyway.
+def preflight_warning(diagnostic):
+    return preflight_message(diagnostic, "Possible syntax error") if diagnostic else None
+
+
+# Method to run the code on an installed local toolchain instead of JDoodle.
+async def execute_local(backend, script, input=None, compile_only=False, timeout=None):
+    async with local_semaphore:
+        write_log(f"run_code: running {backend.language_code} locally")
+        response = await backend.execute(script, input, compile_only, timeout, run_limits, artifact_cache)
+    response['id'] = generate_code_id()
+    response['extra_response_instructions'] = extra_response_instructions
+    return response
+
+
 # Utility method for timestamp conversion.
 def timestamp_to_iso(ts):
     # ts is a timestamp in milliseconds
@@ -159,138 +486,184 @@ def timestamp_to_iso(ts):
     return iso
 
 
-# Method to run the code.
-@app.route('/run_code', methods=['POST'])
-async def run_code():
+# Method to parse a time given as ISO 8601 or as a timestamp in milliseconds, naive times are UTC.
+def parse_time(value):
+    if not value:
+        return None
     try:
-        data = await request.json
-        write_log(f"run_code: data is {data}")
-        script = data.get('code')
-        language = data.get('language')
-
-        # Convert the language to the JDoodle language code.
-        language_code = lang_codes.get(language, language)
-        write_log(f"run_code: language code is {language_code}")
+        milliseconds = float(value)
+    except ValueError:
+        milliseconds = None
+    if milliseconds is not None:
+        # Out of range timestamps like 1e20 or inf raise OverflowError or OSError.
+        try:
+            return datetime.fromtimestamp(milliseconds / 1000, timezone.utc)
+        except (ValueError, OverflowError, OSError):
+            raise ValueError(f"Invalid time: {value}")
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"Invalid time: {value}")
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+# Method to run the code of a request, returns the response dictionary or a streaming response.
+async def process_code(data):
+    script = data.get('code')
+    language = data.get('language')
+    timeout = get_run_timeout(data)
+
+    # Convert the language to the JDoodle language code.
+    language_code = lang_codes.get(language, language)
+    write_log(f"run_code: language code is {language_code}")
+
+    # Run the code locally if the language is python3.
+    if language_code == 'python3':
+        analysis = script_analyzer.analyze(script or "")
+        graph_name = ""
+        graph_options = None
+
+        # Restrict access to external resources.
+        if analysis.blocked:
+            write_log("run_code: Restricted library found in script blocking execution.")
+            error_msg = {"error": "Access to external resources is restricted\nYou can only access whitelisted resources like code-runner-plugin, openai, etc."}
+            return error_msg
+
+        # Report syntax errors with their position without using a worker.
+        diagnostic = await syntax_checker.check(language_code, script or "")
+        if diagnostic:
+            return preflight_error(diagnostic)
+
+        # The show() calls are removed, the worker saves every open figure instead.
+        script = analysis.script
+        if analysis.contains_graph:
+            graph_name = f"graph_{random.randrange(1, 100000)}"
+            graph_options = get_graph_options(data)
+
+        # Stream stdout and stderr as server-sent events if requested.
+        if data.get('stream'):
+            write_log(f"run_code: streaming python script output")
+            return stream_python(script, timeout, graph_name, graph_options)
+
+        if analysis.contains_graph:
+            write_log("run_code: Graph found in script. Running it on a worker with graph capture.")
+            result = await execute_python(script, capture_graph=graph_options, timeout=timeout)
+            write_log(f"run_code: executed python script")
+
+            # Nothing to save when the script was killed or drew nothing.
+            if result["timed_out"] or not result["graphs"]:
+                return python_output(result)
+
+            # Return the premium error message if the user is not premium
+            if not is_user_premium:
+                return premium_feature_error_message()
+
+            # Save the figures rendered by the worker
+            write_log(f"run_code: saving {len(result['graphs'])} plot(s)")
+            links = await save_graphs(graph_name, graph_options, result["graphs"])
+
+            download_link = links[0]
+            response = {"output": download_link}
+            if len(links) > 1:
+                response['graphs'] = links
+
+            # obsolete support message for Graphical libraries.
+            response['support'] = "Warning:The support for matplotlib is going to be obsolete in future you can use QuickChart(/quick_chart) to generate all your graphs now.\n"
+            response['extra_response_instructions'] = extra_response_instructions + "\nFor Output graph use markdown to display it then dont use codeblock now use image tag to display it.\n\n" + "Example:\n" + "![Graph](" + download_link + ")"
+            return response
 
-        # Run the code locally if the language is python3.
-        if language_code == 'python3':
-            response = {}
-            try:
-                graph_file = ""
-                contains_graph = False
-
-                # check if script imports requests library - Restrict access to external resources.
-                if any(library in script for library in ['import requests', 'import pandas', 'import urllib.request', 'import urllib']):
-                    write_log("run_code: Requests library found in script. Trying to restrict access to external resources.")
-                    if "code-runner-plugin" not in script:
-                        write_log("run_code: Requests library found in script blocking execution.")
-                        error_msg = {"error": "Access to external resources is restricted\nYou can only access whitelisted resources like code-runner-plugin, openai, etc."}
-                        return jsonify(error_msg)
-
-                # check is script has graphic libraries imported like matplotlib, seaborn, etc.
-                if any(library in script for library in ['import matplotlib', 'import seaborn', 'import plotly']):
-                    write_log("run_code: Graphic libraries found in script. Trying to run Python code locally with all Libs installed.")
-
-                    # check if script contains "show()" method.
-                    if any(method in script for method in ['show()', 'plt.show()', 'pyplot.show()']):
-                        contains_graph = True
-                        # generate random name for graph file.
-                        graph_file = f"graph_{random.randrange(1, 100000)}.png"
-
-                        # replacing the line if it contains show() method
-                        script = "\n".join([line for line in script.splitlines() if "show()" not in line])
-
-                        response = execute_code(script)
-                        write_log(f"run_code: executed python script")
-
-                        # Save the plot as an image file in a buffer
-                        if contains_graph:
-                            write_log(f"run_code: saving plot")
-                            response = save_graph(graph_file)
-
-                        if response.__len__() == 0 and contains_graph:
-
-                            # Return the premium error message if the user is not premium
-                            if not is_user_premium:
-                                return premium_feature_error_message()
-
-                            download_link = f"{plugin_url}/download/{graph_file}"
-                            response = {"output": download_link}
-
-                            # obsolete support message for Graphical libraries.
-                            response['support'] = "Warning:The support for matplotlib is going to be obsolete in future you can use QuickChart(/quick_chart) to generate all your graphs now.\n"
-                            response['extra_response_instructions'] = extra_response_instructions + "\nFor Output graph use markdown to display it then dont use codeblock now use image tag to display it.\n\n" + "Example:\n" + "![Graph](" + download_link + ")"
-                            return response
-                        else:
-                            response = {"result": response}
-
-                    # Return the response as JSON
-                    else:
-                        write_log(f"run_code: running script locally no graphic libraries found")
-                        response = execute_code(script)
-                        response = {"output": response}
+        write_log(f"run_code: running script locally no graph found")
+        response = python_output(await execute_python(script, timeout=timeout))
 
-                else:
-                    response = execute_code(script)
-                    response = {"output": response}
+        # Append the link to the discord and github repos.
+        # response['support'] = support_message
+        response['extra_response_instructions'] = extra_response_instructions
 
-                # Append the link to the discord and github repos.
-                # response['support'] = support_message
-                response['extra_response_instructions'] = extra_response_instructions
+        return response
 
-                return jsonify(response)
-            except Exception as e:
-                stack_trace = traceback.format_exc()
-                raise e
+    # Section of JDoodle API call.
+    input = data.get('input', None)
+    compile_only = data.get('compileOnly', False)
+    is_code_empty = not script or script.isspace(
+    ) or script == '' or script.__len__() == 0
 
-        # Section of JDoodle API call.
-        input = data.get('input', None)
-        compile_only = data.get('compileOnly', False)
+    if is_code_empty:
+        script = data.get('code')
         is_code_empty = not script or script.isspace(
         ) or script == '' or script.__len__() == 0
 
         if is_code_empty:
-            script = data.get('code')
-            is_code_empty = not script or script.isspace(
-            ) or script == '' or script.__len__() == 0
-
-            if is_code_empty:
-                return jsonify({"error": "Code is empty.Please enter the code and try again."})
-
-        # Get the JDoodle client ID and secret.
-        client_id, client_secret = get_jdoodle_client()
-        headers = {
-            'Content-Type': 'application/json',
-            'X-Requested-With': 'XMLHttpRequest',
-            'Origin': 'code-runner-plugin.vercel.app',
-            'Referer': 'https://code-runner-plugin.vercel.app'
-        }
+            return {"error": "Code is empty.Please enter the code and try again."}
+
+    # Run on the local toolchain when it is installed, unless routed to JDoodle.
+    routing = config.language_routing.get(language_code, config.default_routing)
+    backend = get_backend(language_code) if routing != "jdoodle" else None
+    if backend is None and routing == "local":
+        return {"error": f"Language {language_code} is not installed on this server."}
+
+    # Only code that parses is sent to JDoodle, local compilers report their own errors.
+    warning = None
+    if backend is None:
+        diagnostic = await syntax_checker.check(language_code, script)
+        if diagnostic and diagnostic["blocking"]:
+            return preflight_error(diagnostic)
+        warning = preflight_warning(diagnostic)
 
-        body = {
-            'clientId': client_id,
-            'clientSecret': client_secret,
-            'script': script,
-            'language': language_code,
-            'stdin': input,
-            'compileOnly': compile_only,
-            'versionIndex': '0',
-        }
-        # Filter out the client ID, client secret from the body.
-        body_filtered = {
-            k: v
-            for k, v in body.items() if k not in ['clientId', 'clientSecret']
-        }
+    try:
+        if backend:
+            response = await execute_local(backend, script, input, compile_only, timeout)
+        else:
+            response = await execute_jdoodle(script, language_code, input, compile_only, timeout)
+    except (asyncio.TimeoutError, httpx.TimeoutException):
+        response = {"error": f"Code execution timed out after {timeout} seconds", "timed_out": True}
+
+    if warning:
+        response["preflight_warning"] = warning
+    return response
 
-        response_data = requests.post(compiler_url, headers=headers, data=json.dumps(body))
-        response = json.loads(response_data.content.decode('utf-8'))
 
-        # Append the discord and github URLs to the response.
-        if response_data.status_code == 200:
-            unique_id = generate_code_id(response)
-            # response['support'] = support_message
-            response['id'] = unique_id
-            response['extra_response_instructions'] = extra_response_instructions
+# Method to run the code of a request through the result cache.
+async def run_request(data):
+    # Look up the result cache unless the client opted out, streamed runs are never cached.
+    cache_key = None
+    language_code = lang_codes.get(data.get('language'), data.get('language'))
+    # Python scripts using randomness, time or input() are never cached.
+    nondeterministic = language_code == 'python3' and script_analyzer.analyze(data.get('code') or "").nondeterministic
+    if result_cache and not data.get('noCache') and not data.get('stream') and not nondeterministic:
+        # The figure format, DPI and compression change the graph files the response links to.
+        cache_key = ResultCache.key(language_code, data.get('code'), data.get('input'), data.get('compileOnly', False),
+                                    {"graph": get_graph_options(data)})
+        response = await result_cache.get(cache_key)
+        if response is not None:
+            write_log(f"run_code: result cache hit")
+            response['cache'] = "hit"
+            return response
+
+    # Streamed and nondeterministic runs are not shared with other callers.
+    if data.get('stream') or nondeterministic:
+        response = await process_code(data)
+    else:
+        flight_key = ResultCache.key(language_code, data.get('code'), data.get('input'), data.get('compileOnly', False))
+        flight_key += json.dumps([get_run_timeout(data), get_graph_options(data)], sort_keys=True)
+        response = await single_flight.do(flight_key, lambda: process_code(data))
+    if cache_key and isinstance(response, dict):
+        # Only successful runs are cached.
+        if "error" not in response and not response.get("timed_out"):
+            await result_cache.set(cache_key, response)
+        response['cache'] = "miss"
+    return response
+
 
+# Method to run the code.
+@app.route('/run_code', methods=['POST'])
+async def run_code():
+    try:
+        data = await request.json
+        write_log(f"run_code: data is {data}")
+
+        response = await run_request(data)
+        if not isinstance(response, dict):
+            return response
         return jsonify(response)
     except Exception as e:
         error = {"error": str(e)}
@@ -300,19 +673,205 @@ async def run_code():
         return jsonify(error), 500
 
 
+# Method to run one job of a batch, errors are reported in the job result.
+async def run_batch_job(job):
+    try:
+        # Batch jobs are never streamed one by one.
+        job = dict(job, stream=False)
+        language_code = lang_codes.get(job.get('language'), job.get('language'))
+        if language_code == 'python3':
+            # Python jobs are already bounded by the worker pool.
+            return await run_request(job)
+        async with jdoodle_semaphore:
+            return await run_request(job)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+# Method to run a batch of jobs concurrently.
+@app.route('/run_batch', methods=['POST'])
+async def run_batch():
+    try:
+        data = await request.get_json()
+        jobs = data.get('jobs') or []
+        write_log(f"run_batch: {len(jobs)} jobs")
+
+        if not isinstance(jobs, list) or len(jobs) == 0:
+            return jsonify({"error": "jobs must be a non-empty list of {language, code, input}"}), 400
+        if len(jobs) > config.batch_max_jobs:
+            return jsonify({"error": f"A batch can have at most {config.batch_max_jobs} jobs"}), 400
+
+        tasks = [asyncio.ensure_future(run_batch_job(job)) for job in jobs]
+
+        # Stream each result as a JSON line as soon as its job finishes.
+        if data.get('stream'):
+            async def results():
+                async def indexed(index, task):
+                    return index, await task
+                try:
+                    for finished in asyncio.as_completed([indexed(index, task) for index, task in enumerate(tasks)]):
+                        index, result = await finished
+                        yield json.dumps({"index": index, "result": result}) + "\n"
+                finally:
+                    for task in tasks:
+                        task.cancel()
+
+            response = Response(results(), mimetype="application/x-ndjson")
+            response.timeout = config.max_run_timeout + 30
+            return response
+
+        results = await asyncio.gather(*tasks)
+        return jsonify({"results": results, "extra_response_instructions": extra_response_instructions})
+    except Exception as e:
+        write_log(f"run_batch: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+# Method to compare the output of a test case with the expected output, trailing whitespace is ignored.
+def compare_output(expected, actual):
+    expected_lines = [line.rstrip() for line in str(expected).rstrip().splitlines()]
+    actual_lines = [line.rstrip() for line in actual.rstrip().splitlines()]
+    if expected_lines == actual_lines:
+        return True, None
+    diff = difflib.unified_diff(expected_lines, actual_lines, "expected", "actual", lineterm="")
+    return False, "\n".join(diff)
+
+
+# Method to run a Python test case on the worker pool with the case input as stdin.
+async def run_python_case(script, stdin, timeout):
+    started = time.monotonic()
+    # Cases keep the head and tail of a large output like run_code, without spilling it to GridFS.
+    captures = {kind: OutputCapture(config.output_limit, config.output_preview) for kind in ("stdout", "stderr")}
+    on_output = lambda kind, text: captures[kind].write(text)
+    result = await python_pool.run(script, timeout=timeout, on_output=on_output, stdin=stdin)
+    case = {
+        "stdout": captures["stdout"].getvalue(),
+        "stderr": captures["stderr"].getvalue(),
+        "exit_code": 1 if result["error"] else 0,
+        "error": result["error"],
+        "timed_out": result["timed_out"],
+        "time": round(time.monotonic() - started, 3),
+    }
+    if any(capture.spilled for capture in captures.values()):
+        case["truncated"] = True
+    return case
+
+
+# Method to run a test case of a compiled local program.
+async def run_program_case(program, stdin, timeout):
+    async with local_semaphore:
+        result = await program.run(stdin, timeout, run_limits)
+    return {
+        "stdout": result["output"],
+        "exit_code": result["exit_code"],
+        "error": result["error"],
+        "timed_out": result["timed_out"],
+        "time": result["time"],
+    }
+
+
+# Method to run a test case on JDoodle, which compiles the program for every case.
+async def run_jdoodle_case(script, language_code, stdin, timeout):
+    started = time.monotonic()
+    try:
+        async with jdoodle_semaphore:
+            response = await execute_jdoodle(script, language_code, stdin, False, timeout)
+    except (asyncio.TimeoutError, httpx.TimeoutException):
+        response = {"error": f"Code execution timed out after {timeout} seconds", "timed_out": True}
+    return {
+        "stdout": response.get("output", ""),
+        "exit_code": None,
+        "error": response.get("error"),
+        "timed_out": response.get("timed_out", False),
+        "time": round(time.monotonic() - started, 3),
+    }
+
+
+# Method to compile a program once and run it against a list of stdin test cases.
+@app.route('/run_tests', methods=['POST'])
+async def run_tests():
+    try:
+        data = await request.json
+        script = data.get('code')
+        language = data.get('language')
+        tests = data.get('tests')
+        timeout = get_run_timeout(data)
+        write_log(f"run_tests: language {language}")
+
+        if not script or script.isspace():
+            return jsonify({"error": "Code is empty.Please enter the code and try again."}), 400
+        if not isinstance(tests, list) or len(tests) == 0:
+            return jsonify({"error": "tests must be a non-empty list of {input, expected}"}), 400
+        if len(tests) > config.tests_max_cases:
+            return jsonify({"error": f"A test run can have at most {config.tests_max_cases} cases"}), 400
+        # A plain string is the input of a case without expected output.
+        tests = [test if isinstance(test, dict) else {"input": test} for test in tests]
+
+        language_code = lang_codes.get(language, language)
+        program = None
+        warning = None
+        if language_code == 'python3':
+            if script_analyzer.analyze(script).blocked:
+                return jsonify({"error": "Access to external resources is restricted\nYou can only access whitelisted resources like code-runner-plugin, openai, etc."}), 400
+            run_case = lambda stdin: run_python_case(script, stdin, timeout)
+        else:
+            routing = config.language_routing.get(language_code, config.default_routing)
+            backend = get_backend(language_code) if routing != "jdoodle" else None
+            if backend is None and routing == "local":
+                return jsonify({"error": f"Language {language_code} is not installed on this server."}), 400
+            if backend:
+                # Compile once, every case runs the same binary.
+                try:
+                    program = await backend.prepare(script, timeout, run_limits, artifact_cache)
+                except CompileError as e:
+                    return jsonify({"compiled": False, "output": e.result["output"], "error": str(e)})
+                run_case = lambda stdin: run_program_case(program, stdin, timeout)
+            else:
+                diagnostic = await syntax_checker.check(language_code, script)
+                if diagnostic and diagnostic["blocking"]:
+                    return jsonify(dict(preflight_error(diagnostic), compiled=False))
+                warning = preflight_warning(diagnostic)
+                run_case = lambda stdin: run_jdoodle_case(script, language_code, stdin, timeout)
+
+        try:
+            results = await asyncio.gather(*(run_case(test.get('input')) for test in tests))
+        finally:
+            if program:
+                program.close()
+
+        passed = 0
+        for index, (test, result) in enumerate(zip(tests, results)):
+            result["index"] = index
+            if test.get('expected') is not None:
+                result["passed"], diff = compare_output(test['expected'], result["stdout"])
+                if diff:
+                    result["diff"] = diff
+                passed += result["passed"]
+
+        response = {"compiled": True, "results": results, "total": len(results)}
+        if warning:
+            response["preflight_warning"] = warning
+        if any(test.get('expected') is not None for test in tests):
+            response["passed"] = passed
+        return jsonify(response)
+    except Exception as e:
+        write_log(f"run_tests: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 # Method to save the code.
 @app.route('/save_code', methods=['POST'])
 async def save_code():
     response = ""
     try:
-        global database
-        write_log(f"save_code: database is {database}")
+        global async_database
+        write_log(f"save_code: database is {async_database}")
 
         # check if database is connected
-        if database is None:
+        if async_database is None:
             write_log(f"save_code: database is not connected")
-            database = setup_database()
-            write_log(f"save_code: database is {database}")
+            async_database = setup_database(AsyncMongoDB)
+            write_log(f"save_code: database is {async_database}")
 
         data = await request.json  # Get JSON data from request
         write_log(f"save_code: data is {data}")
@@ -330,10 +889,10 @@ async def save_code():
         write_log(f"save_code: filename is {filepath} and code was present")
 
         # Saving the code to database
-        if database is not None:
-            database.save_code(code, language, code_id, filename)
+        if async_database is not None:
+            await deadline.mongo(async_database.save_code(code, language, code_id, filename), "save_code")
         else:
-            write_log(f"Database not connected {database}")
+            write_log(f"Database not connected {async_database}")
             return {"error": "Database not connected"}
 
         write_log(f"save_code: wrote code to file {filepath}")
@@ -341,7 +900,7 @@ async def save_code():
         write_log(f"save_code: download link is {download_link}")
 
         if download_link:
-            download_link = generate_tinyurl(download_link)
+            download_link = await generate_tinyurl(download_link)
             response = {"link": download_link}
             response['extra_response_instructions'] = extra_response_instructions
     except Exception as e:
@@ -358,7 +917,7 @@ async def upload():
         if not is_user_premium:
             return premium_feature_error_message()
 
-        global database
+        global async_database
         # get the request data
         data = await request.get_json()
         write_log(f"upload: data is {data}")
@@ -379,11 +938,12 @@ async def upload():
             contents = bytes(file_data, 'utf-8')
 
             # save the file in the database
-            database.img.put(contents, filename=filename)
+            file_id = await deadline.mongo(async_database.img.put(contents, filename=filename, chunkSize=config.image_chunk_size), "upload")
+            await deadline.mongo(async_database.register_file(filename, "img", file_id), "upload")
 
             # return the download link
             download_link = f"{plugin_url}/download/{filename}"
-            download_link = generate_tinyurl(download_link)
+            download_link = await generate_tinyurl(download_link)
             return jsonify({"link": download_link})
 
         elif file_extension in ['.pdf', '.doc', '.docx', '.csv', '.xls', '.xlsx', '.txt', '.json']:
@@ -392,45 +952,78 @@ async def upload():
             contents = bytes(file_data, 'utf-8')
 
             # save the file in the database
-            database.docs.put(contents, filename=filename)
+            file_id = await deadline.mongo(async_database.docs.put(contents, filename=filename), "upload")
+            await deadline.mongo(async_database.register_file(filename, "docs", file_id), "upload")
             write_log(f"upload: saved file to database")
 
             # return the download link
             download_link = f"{plugin_url}/download/{filename}"
-            download_link = generate_tinyurl(download_link)
+            download_link = await generate_tinyurl(download_link)
             return jsonify({"link": download_link})
     except Exception as e:
         write_log(f"upload: {e}")
         return jsonify({"error": str(e)})
 
 
+# Extensions of the files stored in GridFS buckets, other files are saved codes.
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp')
+DOCUMENT_EXTENSIONS = ('.pdf', '.doc', '.docx', '.csv', '.xls', '.xlsx', '.txt', '.json')
+
+
 @app.route('/download/<filename>')
 async def download(filename):
     try:
         write_log(f"download: filename is {filename}")
-        global database
+        global async_database
+
+        # the file catalog gives the bucket of a GridFS file in one indexed lookup.
+        if filename.startswith('output_') or filename.endswith(IMAGE_EXTENSIONS + DOCUMENT_EXTENSIONS):
+            entry = await deadline.mongo(async_database.locate_file(filename), "download")
+            if entry:
+                file = await deadline.mongo(async_database.open_file(entry["bucket"], entry["file_id"]), "download")
+                if file:
+                    if entry["bucket"] in ("outputs", "docs"):
+                        content_type = "text/plain"
+                    else:
+                        content_type = mimetypes.guess_type(filename)[0] or "image/png"
+                    response = Response(async_database.stream_file(file), content_type=content_type)
+                    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+                    return response
+
+        # check if file is the full output of a script run.
+        if filename.startswith('output_'):
+            write_log(f"download: file is script output")
+            file = await deadline.mongo(async_database.find_file("outputs", filename), "download")
+
+            if file:
+                response = Response(async_database.stream_file(file), content_type="text/plain")
+                response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+                return response
+            return jsonify({"error": "File not found"})
+
         # check the file extension
-        if filename.endswith(('.png', '.jpg', '.jpeg', '.gif')):
+        if filename.endswith(IMAGE_EXTENSIONS):
+            content_type = mimetypes.guess_type(filename)[0] or "image/png"
 
             write_log(f"download: image filename is {filename}")
 
             # check if file is code snippet.
             if filename.startswith('snippet_'):
                 write_log(f"download: image file is code snippet")
-                file = database.snippets.find_one({"filename": filename})
+                file = await deadline.mongo(async_database.find_file("snippets", filename), "download")
 
                 if file:
-                    response = Response(file, content_type="image/png")
+                    response = Response(async_database.stream_file(file), content_type="image/png")
                     response.headers["Content-Disposition"] = f"attachment; filename={filename}"
                     return response
 
             # get the file-like object from gridfs by its filename
-            file = database.graphs.find_one({"filename": filename})
+            file = await deadline.mongo(async_database.find_file("graphs", filename), "download")
 
             # check if the file exists
             if file:
                 # create a streaming response with the file-like object
-                response = Response(file, content_type="image/png")
+                response = Response(async_database.stream_file(file), content_type=content_type)
                 # set the content-disposition header to indicate a file download
                 response.headers["Content-Disposition"] = f"attachment; filename={filename}"
                 return response
@@ -439,15 +1032,15 @@ async def download(filename):
                 # handle the case when the file is not found
                 return jsonify({"error": "File not found"})
 
-        elif filename.endswith(('.pdf', '.doc', '.docx', '.csv', '.xls', '.xlsx', '.txt', '.json')):
+        elif filename.endswith(DOCUMENT_EXTENSIONS):
             write_log(f"download: document filename is {filename}")
-            file = database.docs.find_one({"filename": filename})
+            file = await deadline.mongo(async_database.find_file("docs", filename), "download")
 
             # check if the file exists
             if file:
                 write_log(f"download: document filename is {filename}")
                 # create a streaming response with the file-like object
-                response = Response(file, content_type="text/plain")
+                response = Response(async_database.stream_file(file), content_type="text/plain")
                 # set the content-disposition header to indicate a file download
                 response.headers["Content-Disposition"] = f"attachment; filename={filename}"
                 return response
@@ -459,7 +1052,7 @@ async def download(filename):
         else:
             write_log(f"download: code filename is {filename}")
             # get the code from the database by its filename
-            code = database.find_code(filename)
+            code = await deadline.mongo(async_database.find_code(filename), "download")
 
             # create a file-like object with the code
             if code:
@@ -486,6 +1079,40 @@ async def download(filename):
         return jsonify({"error": str(e)})
 
 
+# Route to list the stored files a page at a time as JSON lines, filtered by bucket and time range.
+# The last line holds the cursor of the next page when there is one.
+@app.route('/files', methods=['GET'])
+async def list_files():
+    if not config.list_files:
+        return jsonify({"error": "Listing files is disabled"}), 403
+    if async_database is None:
+        return jsonify({"error": "Database not connected"}), 503
+    try:
+        buckets = [bucket.strip() for bucket in request.args.get('bucket', '').split(',') if bucket.strip()]
+        unknown = [bucket for bucket in buckets if bucket not in LISTED_BUCKETS]
+        if unknown:
+            raise ValueError(f"Unknown bucket(s) {unknown}, the buckets are {LISTED_BUCKETS}")
+        since = parse_time(request.args.get('since'))
+        until = parse_time(request.args.get('until'))
+        limit = max(1, min(int(request.args.get('limit') or config.list_files_page), config.list_files_max_page))
+        cursor = request.args.get('cursor')
+        # The cursor is checked before the response starts streaming.
+        if cursor:
+            decode_cursor(cursor)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    async def lines():
+        try:
+            async for item in async_database.list_files(buckets, since, until, cursor, limit):
+                yield json.dumps(item) + "\n"
+        except Exception as e:
+            write_log(f"list_files: {e}")
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return Response(lines(), content_type="application/x-ndjson")
+
+
 # Route for generating code snippets.
 import time
 
@@ -523,22 +1150,31 @@ async def show_snippet():
 
         if kodso:
             # Generate and save the image
-            snippet_link, download_png_url, download_jpg_url, download_svg_url = kodso.show_snippet(code=code, title=title, theme=theme, lang=language, nums=nums, opacity=opacity, blur=blurLines)
+            snippet_link, download_png_url, download_jpg_url, download_svg_url = await kodso.show_snippet(code=code, title=title, theme=theme, lang=language, nums=nums, opacity=opacity, blur=blurLines)
         else:
             return jsonify({"error": "Kodso is not defined"})
 
         # return the download link
         if snippet_link:
-            snippet_link = generate_tinyurl(snippet_link)
+            # The short links are created concurrently over the shared connections.
+            links = (snippet_link, download_png_url, download_jpg_url, download_svg_url)
+            short_links = await asyncio.gather(*(generate_tinyurl(link) for link in links))
+            # Links that could not be shortened in time are returned in full.
+            snippet_link, download_png_url, download_jpg_url, download_svg_url = [short or link for short, link in zip(short_links, links)]
             response = {"snippet_link": snippet_link}
-            response['download_png_url'] = generate_tinyurl(download_png_url)
-            response['download_jpg_url'] = generate_tinyurl(download_jpg_url)
-            response['download_svg_url'] = generate_tinyurl(download_svg_url)
+            if not all(short_links):
+                response['partial'] = True
+            response['download_png_url'] = download_png_url
+            response['download_jpg_url'] = download_jpg_url
+            response['download_svg_url'] = download_svg_url
             response['extra_response_instructions'] = extra_response_instructions + "\nFor Output image use markdown to display it then do not use codeblock now use image tag to display it.\n\n" + "Example:\n" + "![Image](" + snippet_link + ")\nAnd display all download links for all formats."
 
         elapsed_time = time.time() - start_time  # calculate the elapsed time
         write_log(f"save_snippet: elapsed time is {elapsed_time} seconds")
 
+    except DeadlineExceeded as e:
+        write_log(f"save_snippet: {e}")
+        return jsonify({"error": "Generating the snippet took too long, please try again.", "partial": True}), 504
     except Exception as e:
         write_log(f"save_snippet: {e}")
         return jsonify({"error": str(e)})
@@ -577,8 +1213,8 @@ async def user_create():
             updated_at = timestamp_to_iso(updated_at_ms)
 
             # Create the user in the database.
-            database.create_user(id, email, password,
-                                 created_at, updated_at, is_verified)
+            await async_database.create_user(id, email, password,
+                                             created_at, updated_at, is_verified)
 
             return jsonify({"message": "User created successfully", "status": 201})
         else:
@@ -653,8 +1289,8 @@ async def user_update():
             if before_email != after_email or before_id != after_id or before_password != after_password \
                     or created_at_ms_before != created_at_ms_after or updated_at_ms_before != updated_at_ms_after or is_verified_before != is_verified_after:
                 # Update the user in the database.
-                database.update_user(after_id, after_email, after_password,
-                                     created_at_after, updated_at_after, is_verified_after)
+                await async_database.update_user(after_id, after_email, after_password,
+                                                 created_at_after, updated_at_after, is_verified_after)
 
             # Return a success message and status code
             return jsonify({"message": "User updated successfully", "status": 201})
@@ -700,7 +1336,7 @@ async def user_quota():
 
             }
             # Update the user in the database.
-            database.update_user_quota(id, quota)
+            await async_database.update_user_quota(id, quota)
 
             # Return a success message and status code
             return jsonify({"message": "User quota processed successfully", "status": 201})
@@ -745,11 +1381,11 @@ async def create_quickchart():
         write_log(f"quick_chart: chart_type is {chart_type}")
 
         # Call the generate_chart method with the chart type and the chart data
-        graph_file = quick_chart.generate_chart(chart_type, chart_data)
+        graph_file = await quick_chart.generate_chart(chart_type, chart_data)
         write_log(f"quick_chart: generated chart successfully")
 
         download_link = quick_chart.download_link(graph_file)
-        # download_link = generate_tinyurl(download_link)
+        # download_link = await generate_tinyurl(download_link)
 
         # Return a success message and status code
         response = {"output": download_link}
@@ -761,6 +1397,12 @@ async def create_quickchart():
 
         # Return the download link of the chart as a response
         return jsonify(response)
+    except DeadlineExceeded as e:
+        # The chart could not be saved in time, QuickChart can still render it from its URL.
+        write_log(f"quick_chart: {e}")
+        chart_url = quick_chart.chart_url(chart_type, chart_data)
+        return jsonify({"output": chart_url, "status": 200, "partial": True, "chart_type": chart_type,
+                        "message": "Chart could not be saved in time, the link renders it on QuickChart instead."})
     except Exception as e:
         write_log(f"An error occurred: {e}")
         return jsonify({"message": f"An error occurred: {e}", "status": 400})
@@ -813,12 +1455,31 @@ async def plugin_docs():
 @app.route('/credit_limit', methods=["GET"])
 async def credit_limit():
     try:
-        credits_used = get_credits_used()
+        # Served from the local counter, resynced with credit-spent in the background.
+        credits_used = await asyncio.to_thread(credit_tracker.used, get_jdoodle_client_1()[0])
+        credit_tracker.schedule_sync(get_jdoodle_client_1()[0])
         return {"credits:": credits_used}
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+# Route for the execution statistics.
+@app.route('/stats', methods=["GET"])
+async def stats():
+    try:
+        response = {"code_cache": code_cache.stats(), "single_flight": single_flight.stats(), "syntax_check": syntax_checker.stats(),
+                    "jdoodle_clients": await asyncio.to_thread(jdoodle_pool.stats), "jdoodle_policy": jdoodle_policy.stats(), "http": http_client.stats()}
+        if result_cache:
+            response["result_cache"] = result_cache.stats()
+        if artifact_cache:
+            response["artifact_cache"] = artifact_cache.stats()
+        if write_behind:
+            response["write_behind"] = write_behind.stats()
+        return jsonify(response)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 # Route for displaying help message
 @app.route('/help', methods=["GET"])
 async def help():
@@ -886,9 +1547,92 @@ async def read_favicon():
         quart.abort(404, "File not found")
 
 
-def setup_database():
+# Every request except the code runs, which are bounded by their own timeout, gets a deadline.
+@app.before_request
+async def start_deadline():
+    if request.endpoint not in ("run_code", "run_batch", "run_tests"):
+        deadline.start(config.request_deadline)
+
+
+# Start the python workers before the first request so they are already warm.
+@app.before_serving
+async def start_python_pool():
+    python_pool.start()
+
+
+# Method to create and verify the indexes of the lookups, with a deadline of its own.
+async def ensure_indexes():
+    token = deadline.start(config.request_deadline)
+    try:
+        await deadline.mongo(async_database.ensure_indexes(), "provision_indexes")
+        write_log("provision_indexes: indexes are ready")
+    except Exception as e:
+        write_log(f"provision_indexes: {e}")
+    finally:
+        deadline.reset(token)
+
+
+# Provision the indexes in the background so an unreachable database does not delay startup.
+@app.before_serving
+async def provision_indexes():
+    global index_task
+    if async_database is not None:
+        index_task = asyncio.create_task(ensure_indexes())
+
+
+# Start flushing the write-behind queue, outside any request so it has no request deadline.
+@app.before_serving
+async def start_write_behind():
+    if write_behind:
+        write_behind.start()
+
+
+# Resync the JDoodle credit counters in the background while the app runs.
+@app.before_serving
+async def start_credit_sync():
+    global credit_sync_task
+    credit_sync_task = asyncio.create_task(credit_tracker.run(list(jdoodle_credentials)))
+
+
+@app.after_serving
+async def stop_python_pool():
+    python_pool.shutdown()
+
+
+@app.after_serving
+async def stop_credit_sync():
+    if credit_sync_task:
+        credit_sync_task.cancel()
+
+
+@app.after_serving
+async def stop_provision_indexes():
+    if index_task and not index_task.done():
+        index_task.cancel()
+
+
+# Close the keep-alive connections of the shared HTTP client.
+@app.after_serving
+async def close_http_client():
+    await http_client.aclose()
+
+
+# Write what is still queued before the database client is closed.
+@app.after_serving
+async def stop_write_behind():
+    if write_behind:
+        await write_behind.stop()
+
+
+@app.after_serving
+async def close_async_database():
+    if async_database is not None:
+        await async_database.close()
+
+
+def setup_database(database_class=MongoDB):
     try:
-        database = MongoDB()
+        database = database_class()
         write_log(f"Database connected successfully {database}")
         return database
     except Exception as e:
@@ -0,0 +1,112 @@
+"""
+Description: Benchmark of the sync MongoDB class against AsyncMongoDB under concurrent load.
+Each mode runs the same number of operations with the same concurrency from one event
+loop, the way the request handlers call the database:
+  sync   - the sync method called directly in the coroutine (blocks the event loop)
+  thread - the sync method run in a thread (asyncio.to_thread, lib/deadline.call)
+  async  - the AsyncMongoDB coroutine awaited
+and reports the throughput, the latency percentiles and the worst event loop lag.
+Documents are written with a "benchmark_" filename prefix and deleted afterwards.
+
+Usage: MONGODB_URI=... python tools/benchmark_mongo.py [--operations 500] [--concurrency 50]
+"""
+
+import os
+import sys
+import time
+import uuid
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.mongo_db import MongoDB
+from lib.async_mongo_db import AsyncMongoDB
+
+SCRIPT = "print('benchmark')\n" * 20
+
+
+def percentile(values, quantile):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * quantile))]
+
+
+# Coroutine measuring how late the event loop wakes up a sleeper, the lag handlers would see.
+async def measure_lag(lags, stop, interval=0.01):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, loop.time() - expected))
+
+
+async def run_mode(mode, sync_database, async_database, operation, filenames, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, lags = [], []
+    stop = asyncio.Event()
+
+    async def one(filename):
+        async with semaphore:
+            started = time.perf_counter()
+            if operation == "save_code":
+                args = (SCRIPT, "py", uuid.uuid4().hex, f"benchmark_{mode}_{filename}")
+            else:
+                args = (filename,)
+            if mode == "sync":
+                getattr(sync_database, operation)(*args)
+            elif mode == "thread":
+                await asyncio.to_thread(getattr(sync_database, operation), *args)
+            else:
+                await getattr(async_database, operation)(*args)
+            latencies.append(time.perf_counter() - started)
+
+    lag_task = asyncio.create_task(measure_lag(lags, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*[one(filename) for filename in filenames])
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await lag_task
+    return {
+        "mode": mode,
+        "ops_per_second": len(filenames) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_loop_lag_ms": max(lags, default=0.0) * 1000,
+    }
+
+
+async def main(arguments):
+    sync_database = MongoDB()
+    async_database = AsyncMongoDB()
+    print(f"Seeding {arguments.seed} code documents")
+    seeded = [f"benchmark_seed_{index}.py" for index in range(arguments.seed)]
+    await async_database.db["codes"].insert_many([{"script": SCRIPT, "language": "py", "id": uuid.uuid4().hex, "filename": filename}
+                                                  for filename in seeded])
+    try:
+        results = []
+        for operation in arguments.operation:
+            filenames = [seeded[index % len(seeded)] for index in range(arguments.operations)]
+            for mode in arguments.mode:
+                result = await run_mode(mode, sync_database, async_database, operation, filenames, arguments.concurrency)
+                result["operation"] = operation
+                results.append(result)
+    finally:
+        await async_database.db["codes"].delete_many({"filename": {"$regex": "^benchmark_"}})
+        await async_database.close()
+
+    print(f"\n{arguments.operations} operations, concurrency {arguments.concurrency}")
+    print(f"{'operation':<10} {'mode':<7} {'ops/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'loop lag ms':>12}")
+    for result in results:
+        print(f"{result['operation']:<10} {result['mode']:<7} {result['ops_per_second']:>9.1f} {result['p50_ms']:>9.2f} "
+              f"{result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['max_loop_lag_ms']:>12.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare MongoDB and AsyncMongoDB under concurrent load.")
+    parser.add_argument("--operations", type=int, default=500, help="operations per mode")
+    parser.add_argument("--concurrency", type=int, default=50, help="operations in flight at once")
+    parser.add_argument("--seed", type=int, default=100, help="code documents to read from")
+    parser.add_argument("--operation", nargs="+", default=["find_code", "save_code"], choices=["find_code", "save_code"])
+    parser.add_argument("--mode", nargs="+", default=["sync", "thread", "async"], choices=["sync", "thread", "async"])
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,106 @@
+"""
+Description: One-shot migration of the base64 image documents of the graphs collection to
+the graphs GridFS bucket, where MongoDB.save_image now stores images in chunks.
+Documents are read in batches in _id order. Each image is decoded a slice at a time into
+a GridFS upload stream whose file id is the document _id, so ids returned by the old
+save_image stay valid. The document is deleted once its file is written. Progress is
+printed after every batch. The migration can be stopped and run again: images already in
+the bucket are skipped and their documents removed.
+
+Usage: MONGODB_URI=... python tools/migrate_images.py [--batch-size 100] [--chunk-size 261120] [--keep] [--dry-run]
+"""
+
+import os
+import sys
+import time
+import base64
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gridfs import GridFSBucket
+from gridfs.errors import FileExists
+
+from config import Config
+from lib.mongo_db import MongoDB
+
+config = Config()
+
+# Characters of base64 decoded at a time, a multiple of 4 so every slice decodes on its own.
+DECODE_SLICE = 4 * 64 * 1024
+
+
+# Method to write the decoded image into GridFS one slice at a time.
+def migrate_document(bucket, document):
+    encoded = document["image"]
+    stream = bucket.open_upload_stream_with_id(document["_id"], document["id"],
+                                               metadata={"id": document["id"], "timestamp": document.get("timestamp"),
+                                                         "migrated": True})
+    try:
+        for start in range(0, len(encoded), DECODE_SLICE):
+            stream.write(base64.b64decode(encoded[start:start + DECODE_SLICE]))
+    except FileExists:
+        # Aborting would delete the chunks of the file that already exists.
+        raise
+    except BaseException:
+        stream.abort()
+        raise
+    stream.close()
+    return stream.length
+
+
+def main(arguments):
+    database = MongoDB()
+    legacy = database.db["graphs"]
+    bucket = GridFSBucket(database.db, bucket_name="graphs", chunk_size_bytes=arguments.chunk_size)
+    query = {"image": {"$exists": True}}
+    total = legacy.count_documents(query)
+    print(f"{total} base64 image document(s) to migrate, batches of {arguments.batch_size}, chunks of {arguments.chunk_size} bytes")
+
+    done = migrated = skipped = failed = 0
+    encoded_bytes = stored_bytes = 0
+    last_id = None
+    started = time.monotonic()
+    while True:
+        batch_query = dict(query, **({"_id": {"$gt": last_id}} if last_id is not None else {}))
+        batch = list(legacy.find(batch_query).sort("_id", 1).limit(arguments.batch_size))
+        if not batch:
+            break
+        finished = []
+        for document in batch:
+            last_id = document["_id"]
+            done += 1
+            encoded_bytes += len(document["image"])
+            if arguments.dry_run:
+                continue
+            try:
+                if database.db["graphs.files"].find_one({"_id": document["_id"]}, {"_id": 1}):
+                    raise FileExists(document["_id"])
+                stored_bytes += migrate_document(bucket, document)
+                database.register_file(document["id"], "graphs", document["_id"])
+                migrated += 1
+            except FileExists:
+                # Written by an earlier run that stopped before deleting the document.
+                skipped += 1
+            except Exception as e:
+                failed += 1
+                print(f"Failed to migrate image {document.get('id')} ({document['_id']}): {e}")
+                continue
+            finished.append(document["_id"])
+        if finished and not arguments.keep:
+            legacy.delete_many({"_id": {"$in": finished}})
+        elapsed = time.monotonic() - started
+        print(f"{done}/{total} ({100 * done / max(total, 1):.1f}%) migrated {migrated}, skipped {skipped}, failed {failed}, "
+              f"{encoded_bytes / 1048576:.1f} MiB base64 -> {stored_bytes / 1048576:.1f} MiB, {done / max(elapsed, 1e-6):.1f} images/s")
+
+    print(f"Done in {time.monotonic() - started:.1f}s" + (" (dry run, nothing was written)" if arguments.dry_run else ""))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate base64 image documents to the graphs GridFS bucket.")
+    parser.add_argument("--batch-size", type=int, default=100, help="documents read per batch")
+    parser.add_argument("--chunk-size", type=int, default=config.image_chunk_size, help="GridFS chunk size in bytes")
+    parser.add_argument("--keep", action="store_true", help="keep the base64 documents after migrating them")
+    parser.add_argument("--dry-run", action="store_true", help="only count the documents and their size")
+    sys.exit(main(parser.parse_args()))